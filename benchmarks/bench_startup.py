@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Measures startup of the CLI: import time reported by python -X importtime for the entry point
+# and for the module of every subcommand, and wall time of "<subcommand> --help".
+# Usage: python3 benchmarks/bench_startup.py [-r repeat] [-o results.json]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from polygon_to_ejudge.polygon_to_ejudge import SUBCOMMANDS
+
+HEAVY_MODULES = ['bs4', 'requests', 'yaml', 'polygon_cli']
+
+
+def get_import_time(statement: str) -> dict:
+    # Cumulative time of top level imports in microseconds and heavy modules that were imported.
+    # Imports done by interpreter startup are included, see 'python' in results
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+        check=True,
+    )
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            total += int(cumulative)
+        modules.add(name.strip())
+    return {
+        'import_us': total,
+        'heavy_modules': [module for module in HEAVY_MODULES if module in modules],
+    }
+
+
+def get_wall_time(args: list, repeat: int) -> float:
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'run.py'] + args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time of polygon-to-ejudge CLI')
+    parser.add_argument('-r', '--repeat', help='Number of runs of every command', type=int, default=5)
+    parser.add_argument('-o', '--output', help='File to write JSON results to, stdout by default')
+    options = parser.parse_args()
+
+    results = {
+        'python': get_import_time('pass'),
+        'main': dict(
+            get_import_time('from polygon_to_ejudge import main'),
+            help_s=get_wall_time(['--help'], options.repeat),
+        ),
+    }
+    # Module of the subcommand is imported only when it runs, its import is measured after the entry point
+    for subcommand in SUBCOMMANDS:
+        module_name = subcommand['function'].rsplit('.', 1)[0]
+        results[subcommand['name']] = dict(
+            get_import_time('from polygon_to_ejudge import main; import polygon_to_ejudge.{}'.format(module_name)),
+            help_s=get_wall_time([subcommand['name'], '--help'], options.repeat),
+        )
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# Times statement.process_statement_xml on a generated statement of about 1 MB.
+# Usage: python3 benchmarks/bench_statement_xml.py [size in bytes]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from polygon_to_ejudge.statement import process_statement_xml
+
+STATEMENT_PART = '''<statement language="ru_RU"><description><p>Дано число \\(n &lt; 10^5\\) и массив
+\\(a_1, a_2, \\ldots, a_n\\), где \\(a_i &amp;gt; 0\\). Найдите \\[\\sum_{i=1}^{n} a_i \\textgreater 0\\].</p>
+<p>Если ответ больше \\(10^9\\), выведите &lt;&lt;NO&gt;&gt;.</p></description>
+<input_format><p>В первой строке \\(1 \\le n \\le 10^5\\).</p></input_format></statement>
+<examples><example><input>3
+1 2 3</input><output>6</output></example></examples>
+'''
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024 * 1024
+    statement = STATEMENT_PART * (size // len(STATEMENT_PART) + 1)
+
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        process_statement_xml(statement)
+        times.append(time.perf_counter() - start)
+    print('process_statement_xml: {} chars, best of 5: {:.3f} s'.format(len(statement), min(times)))
+
+
+if __name__ == '__main__':
+    main()
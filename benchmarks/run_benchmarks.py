@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# Times import of a problem and a contest, update, valuer generation, serve.cfg parsing and writing
+# and statement conversion on synthetic packages and contests. Polygon is not used: packages are
+# generated locally and "downloaded" by copying. Results are printed as JSON, so they can be compared between versions.
+# Usage: python3 benchmarks/run_benchmarks.py [-o results.json] [--tests N] [--problems N] ...
+
+import argparse
+from collections import OrderedDict
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from polygon_to_ejudge import common, import_problem, package_cache, polygon_session, statement
+from polygon_to_ejudge.common import Config
+from polygon_to_ejudge.gvaluer import generate_valuer
+from polygon_to_ejudge.update_problem import update_problem
+
+from synthetic import make_contest, make_package
+
+POLYGON_ID = 100001
+
+
+class LocalPolygon:
+    # Packages by revision, latest revision is returned by problems.list
+    def __init__(self, packages_dir: str, options):
+        self.packages_dir = packages_dir
+        self.options = options
+        self.revision = 1
+
+    def get_package_path(self, revision: int, name='bench') -> str:
+        path = os.path.join(self.packages_dir, '{}-{}.zip'.format(name, revision))
+        if not os.path.exists(path):
+            make_package(
+                path,
+                name=name,
+                revision=revision,
+                tests=self.options.tests,
+                test_size=self.options.test_size,
+                groups=self.options.groups,
+                languages=self.options.languages,
+                eps_figures=self.options.eps,
+            )
+        return path
+
+
+class LocalProblemSession:
+    polygon = None
+
+    def __init__(self, address, problem_id, pin):
+        self.problem_id = problem_id
+
+    def send_api_request(self, api_method, params, is_json=True, problem_data=True):
+        if api_method == 'problems.list':
+            return [{'id': params['id'], 'name': get_problem_name(params['id']), 'latestPackage': self.polygon.revision}]
+        if api_method == 'contest.problems':
+            return OrderedDict(
+                (chr(ord('A') + i), {'id': POLYGON_ID + i, 'name': get_problem_name(POLYGON_ID + i)})
+                for i in range(self.polygon.options.contest_problems)
+            )
+        raise Exception('Method {} is not available in benchmarks'.format(api_method))
+
+
+def get_problem_name(polygon_id: int) -> str:
+    if polygon_id == POLYGON_ID:
+        return 'bench'
+    return 'bench{}'.format(polygon_id - POLYGON_ID)
+
+
+def download_local_package(session, download_dir, revision=None):
+    # Network is simulated by a delay, so that download can overlap with other work
+    polygon = LocalProblemSession.polygon
+    name = get_problem_name(session.problem_id)
+    time.sleep(polygon.options.download_delay)
+    package_path = os.path.join(download_dir, '{}.zip.part'.format(session.problem_id))
+    shutil.copy(polygon.get_package_path(polygon.revision, name), package_path)
+    return package_path, name
+
+
+def measure(function, repeat: int, setup=None) -> dict:
+    # Setup is called before every run and is not timed, output of function is suppressed
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            function(i)
+            times.append(time.perf_counter() - start)
+    return {
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+    }
+
+
+def bench_config(work_dir: str, options) -> dict:
+    make_contest(work_dir, 1, options.problems)
+    results = {}
+
+    def parse(i):
+        Config(1)
+
+    results['config_parse'] = measure(parse, options.repeat, lambda i: common.config_cache.clear())
+
+    config = Config(1)
+
+    def write(i):
+        config.write()
+
+    def change_config(i):
+        config.common['contest_time'] = 300 + i + 1
+
+    results['config_write'] = measure(write, options.repeat, change_config)
+    results['config_write_unchanged'] = measure(write, options.repeat)
+    return results
+
+
+def bench_valuer(work_dir: str, options) -> dict:
+    package_path = LocalProblemSession.polygon.get_package_path(1)
+    with zipfile.ZipFile(package_path, 'r') as zip_file:
+        tree = ET.fromstring(zip_file.read('problem.xml'))
+    valuer_dir = os.path.join(work_dir, 'valuer')
+    os.makedirs(valuer_dir, exist_ok=True)
+
+    def run(i):
+        generate_valuer(tree, True, False, valuer_dir)
+
+    return {'generate_valuer': measure(run, options.repeat)}
+
+
+def bench_statements(work_dir: str, options) -> dict:
+    package_path = LocalProblemSession.polygon.get_package_path(1)
+    statements_dir = os.path.join(work_dir, 'statements')
+    with zipfile.ZipFile(package_path, 'r') as zip_file:
+        for name in zip_file.namelist():
+            if name.startswith('statement-sections/'):
+                zip_file.extract(name, statements_dir)
+    locations = [
+        os.path.join(statements_dir, 'statement-sections', language)
+        for language in sorted(os.listdir(os.path.join(statements_dir, 'statement-sections')))
+    ]
+
+    def run(i):
+        statement.convert_statements(locations)
+        for location in locations:
+            statement.import_statement(location, os.path.basename(location))
+
+    def clear_cache(i):
+        shutil.rmtree(statement.pandoc_cache_dir, ignore_errors=True)
+
+    return {
+        'statements_cold': measure(run, options.repeat, clear_cache),
+        'statements_cached': measure(run, options.repeat),
+    }
+
+
+def bench_import(work_dir: str, options) -> dict:
+    # Every import goes to a new contest, so the package is "downloaded" and extracted every time
+    polygon = LocalProblemSession.polygon
+    polygon.revision = 1
+    contest_ids = iter(range(100, 100 + options.repeat))
+
+    def setup(i):
+        make_contest(work_dir, 100 + i, options.problems)
+        shutil.rmtree(import_problem.image_cache_dir, ignore_errors=True)
+
+    def run(i):
+        import_problem.import_problem(next(contest_ids), POLYGON_ID)
+
+    results = {'import_problem': measure(run, options.repeat, setup)}
+
+    # Problem of the last contest is updated to new revisions and then to the same one
+    contest_id = 100 + options.repeat - 1
+    problem_id = options.problems + 1
+
+    def next_revision(i):
+        polygon.revision += 1
+
+    def run_update(i):
+        update_problem(contest_id, problem_id)
+
+    results['update_problem'] = measure(run_update, options.repeat, next_revision)
+    results['update_problem_unchanged'] = measure(run_update, options.repeat)
+    return results
+
+
+def bench_import_contest(work_dir: str, options) -> dict:
+    # Every run imports all problems of the contest to a new ejudge contest
+    LocalProblemSession.polygon.revision = 1
+    contest_ids = iter(range(1000, 1000 + options.repeat))
+
+    def setup(i):
+        make_contest(work_dir, 1000 + i)
+        shutil.rmtree(import_problem.image_cache_dir, ignore_errors=True)
+        shutil.rmtree(statement.pandoc_cache_dir, ignore_errors=True)
+
+    def run(i):
+        import_problem.import_contest(next(contest_ids), 1)
+
+    return {'import_contest': measure(run, options.repeat, setup)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of polygon-to-ejudge on synthetic data')
+    parser.add_argument('-o', '--output', help='File to write JSON results to, stdout by default')
+    parser.add_argument('-r', '--repeat', help='Number of runs of every benchmark', type=int, default=3)
+    parser.add_argument('--tests', help='Number of tests in a package', type=int, default=50)
+    parser.add_argument('--test-size', help='Size of every test in bytes', type=int, default=64 * 1024)
+    parser.add_argument('--groups', help='Number of test groups', type=int, default=5)
+    parser.add_argument('--languages', help='Number of statement languages', type=int, default=2)
+    parser.add_argument('--eps', help='Number of EPS figures in every statement', type=int, default=2)
+    parser.add_argument('--problems', help='Number of problems in generated serve.cfg', type=int, default=300)
+    parser.add_argument('--contest-problems', help='Number of problems in imported contest', type=int, default=5)
+    parser.add_argument('--download-delay', help='Time of every package download in seconds', type=float, default=0)
+    parser.add_argument('--keep', help='Do not remove working directory', action='store_true')
+    options = parser.parse_args()
+
+    has_pandoc = shutil.which('pandoc') is not None
+    has_ghostscript = shutil.which('gs') is not None
+    if not has_ghostscript:
+        options.eps = 0
+
+    work_dir = tempfile.mkdtemp(prefix='polygon-to-ejudge-bench-')
+    packages_dir = os.path.join(work_dir, 'packages')
+    judges_dir = os.path.join(work_dir, 'judges')
+    os.makedirs(packages_dir)
+    os.makedirs(judges_dir)
+
+    # Everything is written to the working directory instead of judges folder and caches
+    common.JUDGES_DIR = judges_dir
+    statement.pandoc_cache_dir = os.path.join(work_dir, 'cache', 'pandoc')
+    import_problem.image_cache_dir = os.path.join(work_dir, 'cache', 'images')
+    import_problem.GVALUER_LOCATION = os.path.join(work_dir, 'gvaluer')
+    open(import_problem.GVALUER_LOCATION, 'w').close()
+    import_problem.CREATE_STATEMENTS = has_pandoc
+
+    LocalProblemSession.polygon = LocalPolygon(packages_dir, options)
+    # Revision changes between runs, so polygon API responses are not cached
+    polygon_session.get_polygon_session = lambda: LocalProblemSession(None, None, None)
+    polygon_session.get_problem_session = lambda polygon_id: LocalProblemSession(None, polygon_id, None)
+    polygon_session.api_cache_dir = os.path.join(work_dir, 'cache', 'api')
+    polygon_session.use_api_cache = False
+    package_cache.download_last_package = download_local_package
+
+    results = {}
+    skipped = []
+    try:
+        results.update(bench_config(judges_dir, options))
+        results.update(bench_valuer(work_dir, options))
+        if has_pandoc:
+            results.update(bench_statements(work_dir, options))
+        else:
+            skipped.append('statements')
+        results.update(bench_import(judges_dir, options))
+        results.update(bench_import_contest(judges_dir, options))
+    finally:
+        if not options.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'parameters': {
+            'repeat': options.repeat,
+            'tests': options.tests,
+            'test_size': options.test_size,
+            'groups': options.groups,
+            'languages': options.languages,
+            'eps': options.eps,
+            'problems': options.problems,
+            'contest_problems': options.contest_problems,
+            'download_delay': options.download_delay,
+            'statements': has_pandoc,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandoc': statement.get_pandoc_version() if has_pandoc else None,
+            'ghostscript': has_ghostscript,
+        },
+        'skipped': skipped,
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Generators of synthetic Polygon packages and ejudge contests for benchmarks.
+
+import os
+import zipfile
+
+PROBLEM_XML = '''<?xml version="1.0" encoding="utf-8" standalone="no"?>
+<problem revision="{revision}" short-name="{name}" url="https://polygon.codeforces.com/p/bench/{name}">
+  <names>
+{names}
+  </names>
+  <judging cpu-name="Intel(R) Core(TM) i3-8100 CPU @ 3.60GHz" cpu-speed="3600" input-file="" output-file="">
+    <testset name="tests">
+      <time-limit>1000</time-limit>
+      <memory-limit>268435456</memory-limit>
+      <test-count>{test_count}</test-count>
+      <input-path-pattern>tests/%02d</input-path-pattern>
+      <answer-path-pattern>tests/%02d.a</answer-path-pattern>
+      <tests>
+{tests}
+      </tests>
+      <groups>
+{groups}
+      </groups>
+    </testset>
+  </judging>
+  <files>
+    <resources>
+      <file path="files/olymp.sty"/>
+      <file path="files/testlib.h" type="h.g++"/>
+    </resources>
+  </files>
+  <assets>
+    <checker name="std::wcmp.cpp" type="testlib">
+      <source path="files/check.cpp" type="cpp.g++17"/>
+    </checker>
+    <solutions>
+      <solution tag="main">
+        <source path="solutions/main.cpp" type="cpp.g++17"/>
+      </solution>
+      <solution tag="wrong-answer">
+        <source path="solutions/wa.py" type="python.3"/>
+      </solution>
+    </solutions>
+  </assets>
+  <documents>
+    <document path="documents/description.txt" type="text/plain"/>
+  </documents>
+</problem>
+'''
+
+LANGUAGES = ['russian', 'english', 'ukrainian', 'kazakh', 'uzbek']
+
+LEGEND = '''Даны \\(n\\) чисел \\(a_1, a_2, \\ldots, a_n\\), где \\(0 \\le a_i < 10^9\\).
+Найдите их сумму $$\\sum_{{i=1}}^{{n}} a_i.$$
+
+{figures}
+'''
+
+# Minimal valid EPS file, which is rendered by ghostscript
+EPS = '''%!PS-Adobe-3.0 EPSF-3.0
+%%BoundingBox: 0 0 100 100
+newpath 10 10 moveto 90 {} lineto stroke
+showpage
+%%EOF
+'''
+
+SERVE_CFG = '''# -*- coding: utf-8 -*-
+contest_time = 300
+score_system = kirov
+separate_user_score
+
+[language]
+id = 3
+short_name = "g++"
+long_name = "GNU C++"
+src_sfx = ".cpp"
+
+[problem]
+abstract
+short_name = "Generic"
+use_stdin
+use_stdout
+time_limit = 1
+max_vm_size = 256M
+'''
+
+PROBLEM_SECTION = '''[problem]
+id = {id}
+super = "Generic"
+short_name = "{short_name}"
+long_name = "Problem {id}"
+internal_name = "problem-{id}"
+extid = "polygon:{polygon_id}"
+test_pat = "%02d"
+use_corr
+corr_pat = "%02d.a"
+time_limit = 1
+max_vm_size = 256M
+check_cmd = "check"
+solution_cmd = "main"
+'''
+
+
+def make_tests_xml(tests: int, groups: int):
+    # Tests are split into groups of equal size, each group depends on the previous one
+    tests_xml = []
+    for i in range(tests):
+        group = i * groups // tests
+        tests_xml.append('        <test method="manual" points="{}" group="{}"/>'.format(1 if group > 0 else 0, group))
+    groups_xml = []
+    for group in range(groups):
+        dependencies = ''
+        if group > 0:
+            dependencies = '<dependencies><dependency group="{}"/></dependencies>'.format(group - 1)
+        groups_xml.append('        <group feedback-policy="{}" name="{}" points-policy="{}">{}</group>'.format(
+            'complete' if group == 0 else 'points',
+            group,
+            'complete-group' if group % 2 == 0 else 'each-test',
+            dependencies,
+        ))
+    return '\n'.join(tests_xml), '\n'.join(groups_xml)
+
+
+def make_problem_xml(name: str, revision: int, tests: int, groups: int, languages: int) -> str:
+    names = '\n'.join(
+        '    <name language="{}" value="{} {}"/>'.format(language, name, language)
+        for language in LANGUAGES[:languages]
+    )
+    tests_xml, groups_xml = make_tests_xml(tests, groups)
+    return PROBLEM_XML.format(
+        revision=revision,
+        name=name,
+        names=names,
+        test_count=tests,
+        tests=tests_xml,
+        groups=groups_xml,
+    )
+
+
+def make_package(
+        path: str,
+        name='bench',
+        revision=1,
+        tests=50,
+        test_size=64 * 1024,
+        groups=5,
+        languages=2,
+        eps_figures=2,
+) -> str:
+    # Test contents depend on revision, so that packages of different revisions differ
+    line = '{} {}\n'.format(revision, ' '.join(str(i) for i in range(20)))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('problem.xml', make_problem_xml(name, revision, tests, groups, languages))
+        zip_file.writestr('files/olymp.sty', '% olymp.sty\n')
+        zip_file.writestr('files/testlib.h', '// testlib.h\n')
+        zip_file.writestr('files/check.cpp', '#include "testlib.h"\nint main() {}\n')
+        zip_file.writestr('solutions/main.cpp', 'int main() {}\n')
+        zip_file.writestr('solutions/wa.py', 'print(0)\n')
+        zip_file.writestr('documents/description.txt', 'source_header files/testlib.h\n')
+        for i in range(1, tests + 1):
+            zip_file.writestr('tests/{:02d}'.format(i), (line * (test_size // len(line) + 1))[:test_size])
+            zip_file.writestr('tests/{:02d}.a'.format(i), '{}\n'.format(i))
+        for language in LANGUAGES[:languages]:
+            section_dir = 'statement-sections/{}/'.format(language)
+            figures = '\n'.join('\\epsfbox{{fig{}.eps}}'.format(i) for i in range(eps_figures))
+            zip_file.writestr(section_dir + 'name.tex', '{} {}'.format(name, language))
+            zip_file.writestr(section_dir + 'legend.tex', LEGEND.format(figures=figures))
+            zip_file.writestr(section_dir + 'input.tex', 'В первой строке число \\(n\\) (\\(1 \\le n \\le 10^5\\)).')
+            zip_file.writestr(section_dir + 'output.tex', 'Выведите одно число~--- сумму.')
+            zip_file.writestr(section_dir + 'notes.tex', 'Ответ может не помещаться в 32-битный тип.')
+            zip_file.writestr(section_dir + 'example.01', '3\n1 2 3\n')
+            zip_file.writestr(section_dir + 'example.01.a', '6\n')
+            for i in range(eps_figures):
+                zip_file.writestr(section_dir + 'fig{}.eps'.format(i), EPS.format(10 + i))
+    return path
+
+
+def make_serve_cfg(path: str, problems=0) -> str:
+    # serve.cfg with the given number of imported problems
+    with open(path, 'w') as serve_cfg:
+        serve_cfg.write(SERVE_CFG)
+        for i in range(1, problems + 1):
+            serve_cfg.write('\n')
+            serve_cfg.write(PROBLEM_SECTION.format(id=i, short_name='P{}'.format(i), polygon_id=100000 + i))
+    return path
+
+
+def make_contest(judges_dir: str, contest_id: int, problems=0) -> str:
+    contest_dir = os.path.join(judges_dir, '{:06d}'.format(contest_id))
+    os.makedirs(os.path.join(contest_dir, 'conf'), exist_ok=True)
+    make_serve_cfg(os.path.join(contest_dir, 'conf', 'serve.cfg'), problems)
+    return contest_dir
@@ -0,0 +1,54 @@
+import hashlib
+import os
+import shutil
+import threading
+
+from .common import atomic_write
+from .config import TEST_STORE_DIR
+
+# Files in the store are named by SHA-256 of their content and are hardlinked
+# to problem folders, so the number of links of a file is its reference count.
+
+
+def get_blob_path(digest: str) -> str:
+    return os.path.join(TEST_STORE_DIR, digest[:2], digest[2:])
+
+
+def add_blob(zip_file, zip_info) -> str:
+    # Hash is computed before writing, so files that are already in the store are not written again
+    digest = hashlib.sha256()
+    with zip_file.open(zip_info) as src:
+        for chunk in iter(lambda: src.read(1024 * 1024), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+
+    blob_path = get_blob_path(digest)
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with zip_file.open(zip_info) as src:
+            atomic_write(blob_path, lambda f: shutil.copyfileobj(src, f, 1024 * 1024), mode=0o444, binary=True)
+    return digest
+
+
+def link_blob(digest: str, path: str) -> None:
+    tmp_path = os.path.join(
+        os.path.dirname(path),
+        '.tmp-{}-{}-{}'.format(os.getpid(), threading.get_ident(), os.path.basename(path)),
+    )
+    os.link(get_blob_path(digest), tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def collect_garbage(digests) -> None:
+    # Removes files that are not linked to any problem anymore
+    for digest in set(digests):
+        blob_path = get_blob_path(digest)
+        try:
+            if os.stat(blob_path).st_nlink == 1:
+                os.remove(blob_path)
+        except FileNotFoundError:
+            pass
@@ -1,8 +1,25 @@
 from collections import OrderedDict
+import copy
+import io
 import os
+import shutil
+import tempfile
+import threading
 
+from . import tracing
 from .config import JUDGES_DIR
 
+ejudge_auth_file = os.path.join(os.path.expanduser('~'), '.config', 'polygon-to-ejudge', 'auth.yaml')
+# SID and cookies of logged in sessions by contest id, so that login is not repeated in every run
+ejudge_sessions_file = os.path.join(os.path.dirname(ejudge_auth_file), 'sessions.yaml')
+
+# Problems can be found by values of these keys in O(1)
+INDEXED_KEYS = ['id', 'short_name', 'internal_name', 'extid']
+
+# Parsed serve.cfg files, invalidated when file is changed
+config_cache = {}
+config_cache_lock = threading.Lock()
+
 
 def get_ejudge_contest_dir(contest_id: int) -> str:
     contest_id = "{:06d}".format(int(contest_id))
@@ -10,12 +27,36 @@ def get_ejudge_contest_dir(contest_id: int) -> str:
     return contest_dir
 
 
+def atomic_write(path: str, write, mode=0o644, binary=False) -> None:
+    # write(f) writes content to a temporary file, which is then moved over path,
+    # so readers never see partially written file. If mode is None, mode and owner of the old file are kept
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as f:
+            write(f)
+        if mode is None:
+            shutil.copymode(path, tmp_path)
+            stat = os.stat(path)
+            try:
+                os.chown(tmp_path, stat.st_uid, stat.st_gid)
+            except OSError:
+                pass
+        else:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
 class UnquotedStr:
     def __init__(self, val):
         self.val = val
 
 
 class Config:
+    # Problems should be added, changed and removed with add_problem, update_problem
+    # and remove_problem, so that problem indexes stay valid
     def __init__(self, contest_id: int):
         self.common = OrderedDict()
         self.languages = []
@@ -23,10 +64,26 @@ class Config:
         self.testers = []
         self.end_comments = []
         self.contest_id = contest_id
+        self.problem_index = None
 
         contest_dir = get_ejudge_contest_dir(contest_id)
         self.serve_cfg_path = os.path.join(contest_dir, "conf", "serve.cfg")
 
+        cache_key = self.get_cache_key()
+        with config_cache_lock:
+            cached = config_cache.get(self.serve_cfg_path)
+        if cached is not None and cached[0] == cache_key:
+            self.restore(cached[1])
+        else:
+            self.read()
+            with config_cache_lock:
+                config_cache[self.serve_cfg_path] = (cache_key, self.snapshot())
+
+    def get_cache_key(self):
+        stat = os.stat(self.serve_cfg_path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def read(self) -> None:
         serve_cfg = open(self.serve_cfg_path, "r")
         section_name = 'global'
         section_configs = OrderedDict()
@@ -89,6 +146,60 @@ class Config:
         else:
             raise Exception('unknown config section: {}'.format(section_name))
 
+    def snapshot(self) -> 'Config':
+        # Sections are copied, values are immutable, so snapshot is not changed with the config
+        snapshot = copy.copy(self)
+        snapshot.common = self.common.copy()
+        snapshot.languages = [language.copy() for language in self.languages]
+        snapshot.problems = [problem.copy() for problem in self.problems]
+        snapshot.testers = [tester.copy() for tester in self.testers]
+        snapshot.end_comments = self.end_comments.copy()
+        snapshot.problem_index = None
+        return snapshot
+
+    def restore(self, snapshot: 'Config') -> None:
+        snapshot = snapshot.snapshot()
+        self.common = snapshot.common
+        self.languages = snapshot.languages
+        self.problems = snapshot.problems
+        self.testers = snapshot.testers
+        self.end_comments = snapshot.end_comments
+        self.problem_index = None
+
+    def get_problem_index(self) -> dict:
+        if self.problem_index is None:
+            self.problem_index = {key: {} for key in INDEXED_KEYS}
+            for problem in self.problems:
+                self.index_problem(problem)
+        return self.problem_index
+
+    def index_problem(self, problem: OrderedDict) -> None:
+        for key in INDEXED_KEYS:
+            if key in problem:
+                self.problem_index[key].setdefault(problem[key], problem)
+
+    def find_problem(self, key: str, value):
+        return self.get_problem_index()[key].get(value)
+
+    def get_problem(self, problem_id: int):
+        return self.find_problem('id', problem_id)
+
+    def add_problem(self, problem: OrderedDict) -> None:
+        self.problems.append(problem)
+        if self.problem_index is not None:
+            self.index_problem(problem)
+
+    def update_problem(self, problem: OrderedDict, values: OrderedDict) -> None:
+        problem.update(values)
+        self.problem_index = None
+
+    def remove_problem(self, problem: OrderedDict) -> None:
+        for i in range(len(self.problems)):
+            if self.problems[i] is problem:
+                self.problems.pop(i)
+                break
+        self.problem_index = None
+
     @staticmethod
     def print_prepare(key: str, value) -> str:
         if isinstance(value, bool):
@@ -110,6 +221,7 @@ class Config:
             print(beginning, Config.print_prepare(key, value), file=fout, sep='')
         print(file=fout)
 
+    @tracing.traced('config_write')
     def write(self):
         def get_id(configs: OrderedDict) -> int:
             if 'id' in configs:
@@ -117,7 +229,7 @@ class Config:
             else:
                 return -1
 
-        fout = open(self.serve_cfg_path, 'w')
+        fout = io.StringIO()
         self.print_config(self.common, fout)
 
         self.languages.sort(key=get_id)
@@ -137,4 +249,15 @@ class Config:
 
         for line in self.end_comments:
             print(line, file=fout)
-        fout.close()
+        content = fout.getvalue()
+
+        # Config is written to a temporary file and then moved over serve.cfg,
+        # so ejudge never reads partially written config
+        with open(self.serve_cfg_path, 'r') as serve_cfg:
+            changed = serve_cfg.read() != content
+        if changed:
+            tracing.count('bytes_written', len(content))
+            atomic_write(self.serve_cfg_path, lambda serve_cfg: serve_cfg.write(content), mode=None)
+
+        with config_cache_lock:
+            config_cache[self.serve_cfg_path] = (self.get_cache_key(), self.snapshot())
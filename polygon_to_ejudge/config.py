@@ -10,6 +10,22 @@ IMPORT_ALL_SOLUTIONS = False  # Change it to True if you want to import all solu
 
 TEXTAREA_INPUT = True
 
+PACKAGE_CACHE_SIZE = 4 * 1024 ** 3  # Max total size in bytes of polygon packages kept in download folder of a contest
+
+POLYGON_API_CACHE_TTL = 300  # Seconds for which lists of contest problems from polygon are cached
+
+PREFETCH_THREADS = 8  # Number of packages downloaded at the same time by prefetch
+EXTRACT_THREADS = 8  # Number of threads used to extract files from a package
+
+# Contest import is a pipeline of stages, each stage handles this number of problems at the same time
+IMPORT_DOWNLOAD_THREADS = 4  # Downloads of packages
+IMPORT_EXTRACT_THREADS = 2  # Extraction of packages
+IMPORT_RENDER_THREADS = 2  # Generation of statements, valuers and problem.cfg
+IMPORT_QUEUE_SIZE = 2  # Max number of problems waiting for every stage
+
+USE_TEST_STORE = False  # Change it to True to keep one copy of equal test files of all problems, hardlinked to problems
+TEST_STORE_DIR = JUDGES_DIR + 'polygon-to-ejudge-tests'  # Must be on the same filesystem as contests
+
 # TODO: allow changing above options from script
 
 LANG_IDS = {
@@ -19,6 +35,30 @@ LANG_IDS = {
     "pas": [1],  # Free Pascal
 }
 
+SUBMIT_USE_JSON_API = True  # Submit through ejudge JSON API, HTML form is used if the API is not available
+SUBMIT_THREADS = 4  # Number of solutions submitted to ejudge at the same time
+SUBMIT_RATE_LIMIT = 10  # Max number of requests to ejudge per second
+SUBMIT_RETRIES = 5  # Number of retries of a request to ejudge after server or connection error
+SUBMIT_BACKOFF = 0.5  # Delay in seconds before the first retry, doubled for every next retry
+
+VERDICT_POLL_INTERVAL = 2  # Initial delay in seconds between polls of run statuses
+VERDICT_POLL_MAX_INTERVAL = 60  # Delay is doubled while no run gets verdict, up to this value
+VERDICT_TIMEOUT = 3600  # Stop waiting for verdicts after this number of seconds
+VERDICT_BATCH_SIZE = 100  # Max number of consecutive run ids requested from ejudge at once
+# Ejudge statuses which are expected for solutions with the given Polygon tag
+EXPECTED_VERDICTS = {
+    'main': ['OK', 'AC'],
+    'accepted': ['OK', 'AC'],
+    'rejected': ['CE', 'RT', 'TL', 'PE', 'WA', 'PT', 'ML', 'SE', 'WT'],
+    'wrong-answer': ['WA', 'PT'],
+    'presentation-error': ['PE', 'PT'],
+    'time-limit-exceeded': ['TL', 'WT', 'PT'],
+    'time-limit-exceeded-or-accepted': ['TL', 'WT', 'PT', 'OK', 'AC'],
+    'time-limit-exceeded-or-memory-limit-exceeded': ['TL', 'WT', 'ML', 'RT', 'PT'],
+    'memory-limit-exceeded': ['ML', 'RT', 'PT'],
+    'failed': ['CF'],
+}
+
 PYTHON_LANG_IDS = [23, 64]
 CPP_LANG_IDS = [3, 52]
 SOLUTION_FOLDER_NAMES = ['solutions', 'solutions1']
@@ -28,6 +68,7 @@ RUN_PANDOC = 'pandoc -f latex -t html --mathjax {} -o {}'
 CONVERT_EPS = 'gs -dSAFER -dBATCH -dNOPAUSE -dEPSCrop -r600 -sDEVICE=pngalpha -sOutputFile={} {}'
 IMG_STYLE = 'width: auto; max-width: max(50%, 400px); height: auto; max-height: 100%;'
 IMG_SRC_PREFIX = '${getfile}='
+CONVERT_EPS_THREADS = 4  # Number of eps images rendered in parallel
 
 SCORING_TEXT = {
     'ru_RU': '<h3>Оценивание</h3>\n{}',
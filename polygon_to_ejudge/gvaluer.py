@@ -1,4 +1,5 @@
 from collections import OrderedDict
+import os
 import xml.etree.ElementTree as ET
 
 from .config import GVALUER_GLOBAL_PART, GVALUER_GROUP_BEGIN, GVALUER_TESTS, GVALUER_SCORE, GVALUER_REQUIRES, \
@@ -22,7 +23,7 @@ def get_group_desc(group_id, l, r, score, requires, test_score, sets_marked, off
     return '\n'.join(res)
 
 
-def generate_valuer(tree: ET.ElementTree, has_groups=True, no_offline=False) -> OrderedDict:
+def generate_valuer(tree: ET.ElementTree, has_groups=True, no_offline=False, problem_dir='') -> OrderedDict:
     test_points = []
     test_group = []
 
@@ -81,7 +82,7 @@ def generate_valuer(tree: ET.ElementTree, has_groups=True, no_offline=False) ->
         max_test[test_group[test_id]] = test_id + 1
         group_score[test_group[test_id]] = max(group_score[test_group[test_id]], test_points[test_id])
 
-    valuer = open('valuer.cfg', 'w')
+    valuer = open(os.path.join(problem_dir, 'valuer.cfg'), 'w')
     print(GVALUER_GLOBAL_PART, file=valuer)
     full_score = 0
     full_user_score = 0
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+from .common import atomic_write, get_ejudge_contest_dir
+
+JOURNAL_FILE_NAME = 'import_journal.json'
+
+
+def get_imported_revision(contest_dir: str, internal_name: str):
+    problem_cfg_path = os.path.join(contest_dir, 'problems', str(internal_name), 'problem.cfg')
+    if not os.path.exists(problem_cfg_path):
+        return None
+    with open(problem_cfg_path, 'r') as problem_cfg:
+        for line in problem_cfg.readlines():
+            if '=' in line and line[:line.find('=')].strip() == 'revision':
+                return int(line[line.find('=') + 1:].strip().strip('"'))
+    return None
+
+
+class ImportJournal:
+    # Problems that are done by import or update of a contest, with their revisions.
+    # Journal is saved after every problem and removed when the command completes,
+    # so the same command started after a failure skips problems that are already done.
+    # Ejudge ids and short names allocated by import are saved before it starts,
+    # so problems that are not done yet get the same ids when the import is resumed.
+    # Journal of another command is ignored.
+    def __init__(self, contest_id: int, command: str):
+        self.contest_dir = get_ejudge_contest_dir(contest_id)
+        self.path = os.path.join(self.contest_dir, JOURNAL_FILE_NAME)
+        self.command = command
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as fo:
+                journal = json.load(fo)
+        except (OSError, ValueError):
+            journal = {}
+        self.problems = journal.get('problems', {}) if journal.get('command') == command else {}
+
+    def find(self, key: str, config):
+        # Returns entry of the problem if it is done and was not changed or removed since then
+        entry = self.problems.get(key)
+        if entry is None or 'revision' not in entry:
+            return None
+        problem = config.get_problem(entry['ejudge_problem_id'])
+        if problem is None or str(problem.get('internal_name')) != entry['internal_name']:
+            return None
+        if get_imported_revision(self.contest_dir, entry['internal_name']) != entry['revision']:
+            return None
+        return entry
+
+    def find_allocation(self, key: str, config):
+        # Returns (short_name, ejudge_problem_id) allocated for the problem if both are still free
+        entry = self.problems.get(key)
+        if entry is None or 'short_name' not in entry:
+            return None
+        if config.get_problem(entry['ejudge_problem_id']) is not None or \
+                config.find_problem('short_name', entry['short_name']) is not None:
+            return None
+        return entry['short_name'], entry['ejudge_problem_id']
+
+    def allocate(self, key: str, ejudge_problem_id: int, short_name: str) -> None:
+        # Allocations are saved together by save, before the import starts
+        with self.lock:
+            self.problems[key] = {
+                'ejudge_problem_id': ejudge_problem_id,
+                'short_name': short_name,
+            }
+
+    def add(self, key: str, ejudge_problem_id: int, internal_name: str, revision: int) -> None:
+        with self.lock:
+            self.problems[key] = {
+                'ejudge_problem_id': ejudge_problem_id,
+                'internal_name': str(internal_name),
+                'revision': revision,
+            }
+            self.save()
+
+    def save(self) -> None:
+        journal = {'command': self.command, 'problems': self.problems}
+        atomic_write(self.path, lambda fo: json.dump(journal, fo, indent=1, sort_keys=True))
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
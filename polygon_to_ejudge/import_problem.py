@@ -1,218 +1,422 @@
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import shutil
+import threading
 import xml.etree.ElementTree as ET
 import zipfile
-import random
 from bs4 import BeautifulSoup
 
-from polygon_cli import problem
-from polygon_cli import config as cli_config
-
+from . import polygon_session
+from . import tracing
 from .common import Config, get_ejudge_contest_dir, UnquotedStr
 from .config import PROBLEM_CFG_START, GVALUER_LOCATION, CREATE_STATEMENTS, IMPORT_ALL_SOLUTIONS, CONVERT_EPS, \
-    IMG_STYLE, IMG_SRC_PREFIX, TEXTAREA_INPUT
+    IMG_STYLE, IMG_SRC_PREFIX, TEXTAREA_INPUT, EXTRACT_THREADS, USE_TEST_STORE, \
+    CONVERT_EPS_THREADS, IMPORT_DOWNLOAD_THREADS, IMPORT_EXTRACT_THREADS, IMPORT_RENDER_THREADS, IMPORT_QUEUE_SIZE
 from .gvaluer import generate_valuer
-from .statement import import_statement, process_statement_xml
+from .import_journal import ImportJournal
+from .package_cache import get_package, get_package_problem_name, get_package_polygon_id, get_local_packages, \
+    release_package, get_package_revision, get_latest_revision
+from .pipeline import run_pipeline
+from .problem_files import ProblemFiles, create_staging_dir, swap_problem_dir
+from .statement import import_statement, process_statement_xml, convert_statements
+
 
+# Serializes reads and writes of serve.cfg and allocation of problem directories,
+# so several problems of one contest can be imported at the same time.
+contest_lock = threading.Lock()
 
-def extract_zip(zip_file, prefix):
-    files_list = zip_file.filelist
-    for file in files_list:
-        if file.filename.startswith(prefix):
-            zip_file.extract(file.filename)
+image_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'polygon-to-ejudge', 'images')
 
 
-def move_file_name(file_name):
-    prefix = ''
-    if '/' in file_name:
-        prefix = file_name[:file_name.rfind('/')]
-        file_name = file_name[file_name.rfind('/') + 1:]
-    output_file_name = file_name
+def local_file_name(file_name):
+    if not IMPORT_ALL_SOLUTIONS and file_name.startswith('solutions/'):
+        return 'solutions1/' + file_name[len('solutions/'):]
+    return file_name
+
+
+def moved_file_name(file_name):
+    output_file_name = file_name[file_name.rfind('/') + 1:]
     if output_file_name.endswith("dpr"):
         output_file_name = output_file_name[:-3] + "pas"
-    shutil.copyfile(os.path.join(prefix, file_name), output_file_name)
-    file_name = file_name[:file_name.rfind('.')]
-    return file_name
+    return output_file_name
+
+
+def executable_name(file_name):
+    file_name = file_name[file_name.rfind('/') + 1:]
+    return file_name[:file_name.rfind('.')]
+
+
+def extract_zip(zip_file, prefixes, moved_files, problem_files):
+    # Files are sorted to their destinations in one pass over the archive.
+    # Files from moved_files are additionally written to problem folder root.
+    # Decompression releases GIL, so files are extracted in several threads.
+    destinations = []
+    for file in zip_file.filelist:
+        if file.filename.startswith(tuple(prefixes)):
+            stored = USE_TEST_STORE and file.filename.startswith('tests/')
+            destinations.append((file, local_file_name(file.filename), stored))
+    for file_name in moved_files:
+        destinations.append((zip_file.getinfo(file_name), moved_file_name(file_name), False))
+
+    with ThreadPoolExecutor(max_workers=EXTRACT_THREADS) as executor:
+        futures = [
+            executor.submit(tracing.bind(problem_files.extract), zip_file, file, file_name, stored)
+            for file, file_name, stored in destinations
+        ]
+        for future in futures:
+            future.result()
+
+
+def allocate_problem_id(contest_config: Config, short_name=None):
+    max_problem_id = 0
+    short_names = []
+    for cfg_problem in contest_config.problems:
+        if "id" in cfg_problem:
+            max_problem_id = max(max_problem_id, int(cfg_problem["id"]))
+        if "short_name" in cfg_problem:
+            short_names.append(cfg_problem["short_name"])
+
+    if short_name in short_names or short_name is None:
+        short_name = None
+        for i in range(ord('A'), ord('Z') + 1):
+            if chr(i) not in short_names:
+                short_name = chr(i)
+                break
+        if short_name is None:
+            i = 0
+            while short_name is None:
+                if str(i) not in short_names:
+                    short_name = str(i)
+                i += 1
+    return short_name, max_problem_id + 1
+
+
+def create_problem_dir(problems_dir: str, problem_name: str):
+    with contest_lock:
+        problems = os.listdir(problems_dir)
+        if problem_name in problems:
+            additional_id = 2
+            while "{}-{}".format(problem_name, additional_id) in problems:
+                additional_id += 1
+            problem_name = "{}-{}".format(problem_name, additional_id)
+        problem_dir = os.path.join(problems_dir, problem_name)
+        os.mkdir(problem_dir)
+    return problem_name, problem_dir
+
+
+@tracing.traced('merge_problem_config')
+def merge_problem_config(
+        ejudge_contest_id: int,
+        config: OrderedDict,
+        use_valuer=False,
+        contest_config=None,
+) -> None:
+    # If contest_config is given, problem is only added to it and the caller writes it
+    with contest_lock:
+        write_config = contest_config is None
+        if write_config:
+            contest_config = Config(ejudge_contest_id)
+        old_contest_config = contest_config.snapshot()
+
+        if use_valuer:
+            contest_config.common['separate_user_score'] = 1
+            problems_dir = os.path.join(get_ejudge_contest_dir(ejudge_contest_id), 'problems')
+            shutil.copy(GVALUER_LOCATION, os.path.join(problems_dir, 'gvaluer'))
+
+        problem_cfg = contest_config.get_problem(config['id'])
+        if problem_cfg is not None:
+            contest_config.update_problem(problem_cfg, config)
+        else:
+            contest_config.add_problem(config)
+
+        if write_config:
+            try:
+                contest_config.write()
+            except:
+                old_contest_config.write()
+                raise
+
+
+def get_eps_image_name(eps_path):
+    # Rendered image is named by hash of eps file, so unchanged images are not rendered again
+    with open(eps_path, 'rb') as eps_file:
+        digest = hashlib.sha256(CONVERT_EPS.encode('utf-8') + b'\n' + eps_file.read())
+    return digest.hexdigest()[:20] + '.png'
+
+
+def render_eps(eps_path, name, out_dir):
+    out_path = os.path.join(out_dir, name)
+    if os.path.exists(out_path):
+        return
+    cache_path = os.path.join(image_cache_dir, name)
+    if not os.path.exists(cache_path):
+        os.makedirs(image_cache_dir, exist_ok=True)
+        tmp_path = '{}.{}-{}.tmp'.format(cache_path, os.getpid(), threading.get_ident())
+        tracing.count('subprocesses')
+        os.system(CONVERT_EPS.format(tmp_path, eps_path))
+        if not os.path.exists(tmp_path):
+            print('Failed to convert {}'.format(eps_path))
+            return
+        os.replace(tmp_path, cache_path)
+    shutil.copyfile(cache_path, out_path)
 
 
 def extract_images(statements, src_dir, out_dir):
     st = BeautifulSoup(statements, "xml")
+    used_files = set()
     images = st.find_all("img")
     for img in images:
         try:
             shutil.copyfile(os.path.join(src_dir, img['src']), os.path.join(out_dir, img['src']))
+            used_files.add(img['src'])
         except Exception as e:
             print(e)
         img['src'] = IMG_SRC_PREFIX + img['src']
         img['style'] = IMG_STYLE
 
     epses = st.find_all("embed")
+    eps_names = {}
+    for eps_img in epses:
+        eps_path = os.path.join(src_dir, eps_img['src'])
+        if eps_path not in eps_names:
+            try:
+                eps_names[eps_path] = get_eps_image_name(eps_path)
+            except OSError as e:
+                print(e)
+                eps_names[eps_path] = eps_img['src'] + '.png'
+
+    # Ghostscript runs in separate processes, so images are rendered in parallel
+    with ThreadPoolExecutor(max_workers=CONVERT_EPS_THREADS) as executor:
+        futures = [
+            executor.submit(tracing.bind(render_eps), eps_path, name, out_dir)
+            for eps_path, name in eps_names.items()
+        ]
+        for future in futures:
+            future.result()
+
     for eps_img in epses:
-        name = ''.join([random.choice([str(i) for i in range(10)]) for i in range(10)]) + ".png"
-        os.system(CONVERT_EPS.format(
-            os.path.join(out_dir, name),
-            os.path.join(src_dir, eps_img['src'])
-        ))
+        name = eps_names[os.path.join(src_dir, eps_img['src'])]
+        used_files.add(name)
         img = BeautifulSoup("<img>", features="html.parser")
         img.find('img')['src'] = IMG_SRC_PREFIX + name
         img.find('img')['style'] = IMG_STYLE
         eps_img.replace_with(img)
+
+    # Images left from previous import of the problem
+    for file_name in os.listdir(out_dir):
+        if file_name not in used_files:
+            os.remove(os.path.join(out_dir, file_name))
     return str(st)
 
 
-def import_problem(
-        ejudge_contest_id: int,
-        polygon_id: int,
-        short_name=None,
-        ejudge_problem_id=None,
-        no_offline=False
-) -> None:
-    cli_config.setup_login_by_url('')
-    session = problem.ProblemSession("main", polygon_id, None)
-    contest_dir = get_ejudge_contest_dir(ejudge_contest_id)
-    download_dir = os.path.join(contest_dir, 'download')
-    tmp_dir = os.path.join(contest_dir, 'tmp')
-    problems_dir = os.path.join(contest_dir, 'problems')
-
-    os.chdir(contest_dir)
-
-    contest_config = Config(ejudge_contest_id)
-    old_contest_config = Config(ejudge_contest_id)
-
-    if not ejudge_problem_id:
-        max_problem_id = 0
-        short_names = []
-        for cfg_problem in contest_config.problems:
-            if "id" in cfg_problem:
-                max_problem_id = max(max_problem_id, int(cfg_problem["id"]))
-            if "short_name" in cfg_problem:
-                short_names.append(cfg_problem["short_name"])
-
-        if short_name in short_names or short_name is None:
-            short_name = None
-            for i in range(ord('A'), ord('Z') + 1):
-                if chr(i) not in short_names:
-                    short_name = chr(i)
-                    break
-            if short_name is None:
-                i = 0
-                while short_name is None:
-                    if str(i) not in short_names:
-                        short_name = str(i)
-        ejudge_problem_id = max_problem_id + 1
-
-    if not os.path.exists(download_dir):
-        os.mkdir(download_dir)
-
-    if os.path.isdir(tmp_dir):
-        shutil.rmtree(tmp_dir)
-    os.mkdir(tmp_dir)
-
-    if not os.path.exists(problems_dir):
-        os.mkdir(problems_dir)
-
-    os.chdir(tmp_dir)
-    session.download_last_package()
-    problems = os.listdir(problems_dir)
-    problem_zip_name = os.listdir(tmp_dir)[0]
-    problem_name = problem_zip_name[:problem_zip_name.rfind(".zip")]
-    os.replace(os.path.join(tmp_dir, problem_zip_name), os.path.join(download_dir, problem_zip_name))
-    if problem_name in problems:
-        additional_id = 2
-        while "{}-{}".format(problem_name, additional_id) in problems:
-            additional_id += 1
-        problem_name = "{}-{}".format(problem_name, additional_id)
-    problem_dir = os.path.join(problems_dir, problem_name)
-    try:
-        os.mkdir(problem_dir)
-        os.chdir(problem_dir)
+class ProblemImport:
+    # Import of one problem, split into stages which import_contest runs in a pipeline:
+    # download of the package, extraction of files, generation of statements, valuer and problem.cfg,
+    # and merge of problem config to serve.cfg.
+    # If internal_name of already imported problem is given, files of the problem
+    # are updated in staging folder, writing only the files that changed.
+    # If contest_config is given, problem config is merged to it instead of serve.cfg.
+    # If package_path is given, local package is imported and polygon is not used.
+    # If latest_revision is given, it is not requested from polygon again
+    def __init__(
+            self,
+            ejudge_contest_id: int,
+            polygon_id: int,
+            short_name=None,
+            ejudge_problem_id=None,
+            no_offline=False,
+            internal_name=None,
+            contest_config=None,
+            package_path=None,
+            latest_revision=None,
+    ):
+        if package_path is None:
+            if polygon_id is None:
+                raise Exception('Polygon id or package is required to import problem')
+            self.session = polygon_session.get_problem_session(polygon_id)
+        elif polygon_id is None:
+            polygon_id = get_package_polygon_id(package_path)
+        self.ejudge_contest_id = ejudge_contest_id
+        self.polygon_id = polygon_id
+        self.no_offline = no_offline
+        self.internal_name = internal_name
+        self.contest_config = contest_config
+        self.package_path = package_path
+        self.latest_revision = latest_revision
+        contest_dir = get_ejudge_contest_dir(ejudge_contest_id)
+        self.download_dir = os.path.join(contest_dir, 'download')
+        self.problems_dir = os.path.join(contest_dir, 'problems')
+
+        with contest_lock:
+            if contest_config is None:
+                self.current_config = Config(ejudge_contest_id)
+            else:
+                self.current_config = contest_config.snapshot()
+
+        if not ejudge_problem_id:
+            short_name, ejudge_problem_id = allocate_problem_id(self.current_config, short_name)
+        self.short_name = short_name
+        self.ejudge_problem_id = ejudge_problem_id
+
+        self.problem_zip_path = None
+        self.problem_files = None
+        self.update_existing = False
+
+    def download(self) -> None:
+        os.makedirs(self.download_dir, exist_ok=True)
+        os.makedirs(self.problems_dir, exist_ok=True)
+
+        if self.package_path is None:
+            with tracing.span('download'):
+                self.problem_zip_path = get_package(
+                    self.session,
+                    self.polygon_id,
+                    self.download_dir,
+                    self.latest_revision,
+                )
+        else:
+            self.problem_zip_path = self.package_path
+
+    def extract(self) -> None:
+        problems_dir = self.problems_dir
+        internal_name = self.internal_name
+        problem_zip_path = self.problem_zip_path
+        update_existing = internal_name is not None and os.path.isdir(os.path.join(problems_dir, internal_name))
+        if update_existing:
+            # New version is written to staging folder and replaces problem folder only when it is complete,
+            # so ejudge does not see half-updated problem and previous version is kept for rollback
+            problem_name = internal_name
+            problem_dir = os.path.join(problems_dir, problem_name)
+            files_dir = create_staging_dir(problem_dir)
+        else:
+            problem_name = get_package_problem_name(problem_zip_path)
+            problem_name, problem_dir = create_problem_dir(problems_dir, problem_name)
+            files_dir = problem_dir
+        problem_files = ProblemFiles(files_dir)
+        self.update_existing = update_existing
+        self.problem_name = problem_name
+        self.problem_dir = problem_dir
+        self.files_dir = files_dir
+        self.problem_files = problem_files
 
         interactor_name = None
 
-        with zipfile.ZipFile(os.path.join(download_dir, problem_zip_name), "r") as zip_file:
-            zip_file.extract('problem.xml')
-            xml_file = open('problem.xml', 'r')
-            tree = ET.ElementTree(file=xml_file)
+        with zipfile.ZipFile(problem_zip_path, "r") as zip_file:
+            problem_files.extract(zip_file, zip_file.getinfo('problem.xml'), 'problem.xml')
+            tree = ET.parse(os.path.join(files_dir, 'problem.xml'))
             tree = tree.getroot()
             for solution in tree.find('assets').find('solutions'):
                 if solution.attrib['tag'] == 'main':
-                    solution_name = solution.find('source').attrib['path']
-            extract_zip(zip_file, 'solutions/')
-            solution_name = move_file_name(solution_name)
+                    solution_path = solution.find('source').attrib['path']
+            solution_name = executable_name(solution_path)
 
-            if not IMPORT_ALL_SOLUTIONS:
-                shutil.move(os.path.join(problem_dir, 'solutions/'), os.path.join(problem_dir, 'solutions1/'))
-
-            if tree.find('documents'):
-                extract_zip(zip_file, 'documents/')
-
-            extract_zip(zip_file, 'files/')
-            checker_name = move_file_name(tree.find('assets').find('checker').find('source').attrib['path'])
+            checker_path = tree.find('assets').find('checker').find('source').attrib['path']
+            checker_name = executable_name(checker_path)
+            moved_files = [solution_path, checker_path]
 
             if tree.find('assets').find('interactor'):
-                interactor_name = move_file_name(tree.find('assets').find('interactor').find('source').attrib['path'])
+                interactor_path = tree.find('assets').find('interactor').find('source').attrib['path']
+                interactor_name = executable_name(interactor_path)
+                moved_files.append(interactor_path)
 
             for file in tree.find('files').find('resources'):
-                move_file_name(file.attrib['path'])
-
-            extract_zip(zip_file, 'tests/')
+                moved_files.append(file.attrib['path'])
 
+            prefixes = ['solutions/', 'files/', 'tests/']
+            if tree.find('documents'):
+                prefixes.append('documents/')
             if CREATE_STATEMENTS:
-                extract_zip(zip_file, 'statement-sections')
-                statement_languages = os.listdir(os.path.join(problem_dir, 'statement-sections'))
-
-                problem_xml = ET.Element('problem')
-
-                format_statements = []
-                format_examples = []
-                informatics_statements = None
-                for language in statement_languages:
-                    statement_xml = None
-                    if language == 'russian':
-                        import_statement_res = import_statement(
-                            os.path.join(problem_dir, 'statement-sections', 'russian'),
-                            'ru_RU',
-                        )
-                        format_statements = import_statement_res[2] + format_statements
-                        format_examples = import_statement_res[3]
+                prefixes.append('statement-sections')
+
+            with tracing.span('extract'):
+                extract_zip(zip_file, prefixes, moved_files, problem_files)
+
+        self.tree = tree
+        self.solution_name = solution_name
+        self.checker_name = checker_name
+        self.interactor_name = interactor_name
+
+    def render(self) -> None:
+        # Statements, valuer and problem.cfg are generated from extracted files
+        tree = self.tree
+        files_dir = self.files_dir
+        problem_dir = self.problem_dir
+        problem_files = self.problem_files
+        current_config = self.current_config
+        problem_name = self.problem_name
+        polygon_id = self.polygon_id
+        short_name = self.short_name
+        ejudge_problem_id = self.ejudge_problem_id
+        no_offline = self.no_offline
+        solution_name = self.solution_name
+        checker_name = self.checker_name
+        interactor_name = self.interactor_name
+
+        if CREATE_STATEMENTS:
+            statement_languages = os.listdir(os.path.join(files_dir, 'statement-sections'))
+            with tracing.span('pandoc'):
+                convert_statements([
+                    os.path.join(files_dir, 'statement-sections', language)
+                    for language in statement_languages
+                    if language in ['russian', 'english']
+                ])
+
+            problem_xml = ET.Element('problem')
+
+            format_statements = []
+            format_examples = []
+            informatics_statements = None
+            for language in statement_languages:
+                statement_xml = None
+                if language == 'russian':
+                    import_statement_res = import_statement(
+                        os.path.join(files_dir, 'statement-sections', 'russian'),
+                        'ru_RU',
+                    )
+                    format_statements = import_statement_res[2] + format_statements
+                    format_examples = import_statement_res[3]
+                    informatics_statements = import_statement_res[1]
+                    statement_xml = import_statement_res[0]
+                if language == 'english':
+                    import_statement_res = import_statement(
+                        os.path.join(files_dir, 'statement-sections', 'english'),
+                        'en_EN',
+                    )
+                    format_statements = import_statement_res[2] + format_statements
+                    format_examples = import_statement_res[3]
+                    if informatics_statements is None:
                         informatics_statements = import_statement_res[1]
-                        statement_xml = import_statement_res[0]
-                    if language == 'english':
-                        import_statement_res = import_statement(
-                            os.path.join(problem_dir, 'statement-sections', 'english'),
-                            'en_EN',
-                        )
-                        format_statements = import_statement_res[2] + format_statements
-                        format_examples = import_statement_res[3]
-                        if informatics_statements is None:
-                            informatics_statements = import_statement_res[1]
-                        statement_xml = import_statement_res[0]
-                    if statement_xml:
-                        example = problem_xml.find('examples')
-                        if not example:
-                            problem_xml.insert(0, statement_xml.find('examples'))
-                        problem_xml.insert(0, statement_xml.find('statement'))
-                format_statements.extend(format_examples)
-                if informatics_statements is not None:
-                    informatics_statements_file = open("statements.html", "w")
-                    informatics_statements_file.write(informatics_statements)
-                    informatics_statements_file.close()
-                problem_xml_str = ET.tostring(problem_xml, encoding='utf-8', method='xml').decode('utf-8')
-                problem_xml_str = problem_xml_str.format(*format_statements)
-
-                if len(statement_languages) > 0:
-                    attachments_dir = os.path.join(problem_dir, 'attachments')
-                    os.mkdir(attachments_dir)
+                    statement_xml = import_statement_res[0]
+                if statement_xml:
+                    example = problem_xml.find('examples')
+                    if not example:
+                        problem_xml.insert(0, statement_xml.find('examples'))
+                    problem_xml.insert(0, statement_xml.find('statement'))
+            format_statements.extend(format_examples)
+            if informatics_statements is not None:
+                informatics_statements_file = open(os.path.join(files_dir, "statements.html"), "w")
+                informatics_statements_file.write(informatics_statements)
+                informatics_statements_file.close()
+            problem_xml_str = ET.tostring(problem_xml, encoding='utf-8', method='xml').decode('utf-8')
+            problem_xml_str = problem_xml_str.format(*format_statements)
+
+            if len(statement_languages) > 0:
+                attachments_dir = os.path.join(files_dir, 'attachments')
+                os.makedirs(attachments_dir, exist_ok=True)
+                with tracing.span('images'):
                     problem_xml_str = extract_images(
                         problem_xml_str,
-                        os.path.join(problem_dir, 'statement-sections', statement_languages[0]),
+                        os.path.join(files_dir, 'statement-sections', statement_languages[0]),
                         attachments_dir
                     )
-                # problem_xml_str = process_statement_xml(problem_xml_str)
-                problem_xml_file = open('statements.xml', 'w')
-                problem_xml_file.write(problem_xml_str)
-                problem_xml_file.close()
+            # problem_xml_str = process_statement_xml(problem_xml_str)
+            problem_xml_file = open(os.path.join(files_dir, 'statements.xml'), 'w')
+            problem_xml_file.write(problem_xml_str)
+            problem_xml_file.close()
+
+        problem_files.finish()
 
         input_file = tree.find('judging').attrib['input-file']
         output_file = tree.find('judging').attrib['output-file']
@@ -252,7 +456,7 @@ def import_problem(
 
         config['id'] = ejudge_problem_id
 
-        for prob_conf in contest_config.problems:
+        for prob_conf in current_config.problems:
             if 'abstract' in prob_conf and 'short_name' in prob_conf and prob_conf['short_name'] == "Generic":
                 config["super"] = "Generic"
 
@@ -260,7 +464,8 @@ def import_problem(
         config['long_name'] = russian_name
         problem_config['long_name_en'] = english_name
         config['internal_name'] = problem_name
-        config['extid'] = 'polygon:{}'.format(polygon_id)
+        if polygon_id is not None:
+            config['extid'] = 'polygon:{}'.format(polygon_id)
         problem_config['revision'] = tree.attrib['revision']
         if CREATE_STATEMENTS:
             config['xml_file'] = "statements.xml"
@@ -301,16 +506,17 @@ def import_problem(
         if TEXTAREA_INPUT:
             config['enable_text_form'] = True
 
+        use_valuer = False
         problem_test = tree.find('judging').find('testset').find('tests').find('test')
         if problem_test is not None:
-            valuer_config = generate_valuer(tree, 'points' in problem_test.keys(), no_offline)
-            if contest_config.common['score_system'].val != 'acm':
+            with tracing.span('generate_valuer'):
+                valuer_config = generate_valuer(tree, 'points' in problem_test.keys(), no_offline, files_dir)
+            if current_config.common['score_system'].val != 'acm':
                 config.update(valuer_config)
-                contest_config.common['separate_user_score'] = 1
-                shutil.copy(GVALUER_LOCATION, os.path.join(problems_dir, 'gvaluer'))
+                use_valuer = True
 
         try:
-            problem_description = open('documents/description.txt', 'r')
+            problem_description = open(os.path.join(files_dir, 'documents', 'description.txt'), 'r')
             for line in problem_description.readlines():
                 if line.startswith('source_header'):
                     config['source_header'] = os.path.join(problem_dir, line.split()[1])
@@ -323,67 +529,188 @@ def import_problem(
         except:
             pass
 
-        problem_exists = False
-        for problem_cfg in contest_config.problems:
-            if 'id' in problem_cfg and problem_cfg['id'] == ejudge_problem_id:
-                problem_exists = True
-                problem_cfg.update(config)
-
-        if not problem_exists:
-            contest_config.problems.append(config)
-
         problem_config.update(config)
 
-        problem_cfg_file = open("problem.cfg", "w")
+        problem_cfg_file = open(os.path.join(files_dir, "problem.cfg"), "w")
         print(PROBLEM_CFG_START, file=problem_cfg_file)
         Config.print_config(problem_config, problem_cfg_file)
         problem_cfg_file.close()
-        contest_config.write()
 
-    except Exception as e:
-        os.chdir(contest_dir)
-        shutil.rmtree(problem_dir)
-        old_contest_config.write()
+        self.config = config
+        self.use_valuer = use_valuer
+        self.revision = int(tree.attrib['revision'])
+
+    def merge(self) -> None:
+        # Config is merged before the swap, so if it fails, staging folder is removed by abort
+        # and both problem folder and serve.cfg stay on the previous version
+        merge_problem_config(self.ejudge_contest_id, self.config, self.use_valuer, self.contest_config)
+        if self.update_existing:
+            with tracing.span('swap'):
+                swap_problem_dir(self.files_dir, self.problem_dir)
+
+    def abort(self) -> None:
+        # Staging folder or folder of new problem is removed, current version of the problem is not changed
+        if self.problem_files is not None and os.path.isdir(self.files_dir):
+            self.problem_files.remove()
         print("Failed to load problem")
 
-        raise e
+    def close(self) -> None:
+        if self.package_path is None and self.problem_zip_path is not None:
+            release_package(self.problem_zip_path)
 
+    def run(self) -> None:
+        self.download()
+        try:
+            self.extract()
+            self.render()
+            self.merge()
+        except:
+            self.abort()
+            raise
+        finally:
+            self.close()
 
+
+@tracing.traced('import_problem', 'ejudge_contest_id', 'polygon_id', 'ejudge_problem_id')
+def import_problem(
+        ejudge_contest_id: int,
+        polygon_id: int,
+        short_name=None,
+        ejudge_problem_id=None,
+        no_offline=False,
+        internal_name=None,
+        contest_config=None,
+        package_path=None,
+        latest_revision=None,
+) -> None:
+    ProblemImport(
+        ejudge_contest_id,
+        polygon_id,
+        short_name,
+        ejudge_problem_id,
+        no_offline,
+        internal_name,
+        contest_config,
+        package_path,
+        latest_revision,
+    ).run()
+
+
+@tracing.traced('import_contest', 'ejudge_id', 'polygon_id')
 def import_contest(
         ejudge_id: int,
         polygon_id: int,
-        no_offline=False
+        no_offline=False,
+        jobs=None,
+        package_path=None,
 ) -> None:
-    cli_config.setup_login_by_url('')
-    session = problem.ProblemSession(cli_config.polygon_url, None, None)
-    problems = session.send_api_request('contest.problems', {'contestId': polygon_id}, problem_data=False)
-    problem_keys = list(problems.keys())
-    problem_keys.sort()
-    for key in problem_keys:
-        import_problem(ejudge_id, problems[key]['id'], key, no_offline=no_offline)
-
-
-def add_subparsers(subparsers):
-    parser_import_problem = subparsers.add_parser(
-        'ip',
-        help="Import single problem from polygon"
-    )
-    parser_import_problem.add_argument('contest_id', help='Id of ejudge contest to add problem', type=int)
-    parser_import_problem.add_argument('problem_id', help='Polygon id for the problem', type=int)
-    parser_import_problem.add_argument('-short', help="Short name for the problem", default=None, type=str)
-    parser_import_problem.add_argument('-ej_id', help="Ejudge id for the problem", default=None, type=int)
-    parser_import_problem.add_argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true")
-    parser_import_problem.set_defaults(
-        func=lambda options: import_problem(options.contest_id, options.problem_id, options.short, options.ej_id, options.no_offline)
-    )
-
-    parser_import_contest = subparsers.add_parser(
-        'ic',
-        help="Import contest from polygon to ejudge"
-    )
-    parser_import_contest.add_argument('ejudge_id', help='Ejudge contest id', type=int)
-    parser_import_contest.add_argument('polygon_id', help='Polygon contest id', type=int)
-    parser_import_contest.add_argument("-n", "--no-offline", help="Ignore offline groups in valuer", action="store_true")
-    parser_import_contest.set_defaults(
-        func=lambda options: import_contest(options.ejudge_id, options.polygon_id, options.no_offline)
-    )
+    # If package_path is given, problems are imported from local package or directory of packages.
+    # If jobs is given, it is used as number of threads of every import stage instead of config
+    if package_path is not None:
+        packages = get_local_packages(package_path)
+        if len(packages) == 0:
+            raise Exception('No packages found in {}'.format(package_path))
+        problem_keys = [None] * len(packages)
+        problem_sources = [(None, package) for package in packages]
+        journal_keys = [os.path.basename(package) for package in packages]
+        journal = ImportJournal(ejudge_id, 'ic {}'.format(os.path.abspath(package_path)))
+    else:
+        if polygon_id is None:
+            raise Exception('Polygon contest id or package is required to import contest')
+        session = polygon_session.get_polygon_session()
+        problems = polygon_session.send_cached_api_request(session, 'contest.problems', {'contestId': polygon_id})
+        problem_keys = list(problems.keys())
+        problem_keys.sort()
+        problem_sources = [(problems[key]['id'], None) for key in problem_keys]
+        journal_keys = problem_keys
+        journal = ImportJournal(ejudge_id, 'ic {}'.format(polygon_id))
+
+    # Ejudge ids and short names are allocated before the import starts,
+    # so that the result does not depend on the order in which problems finish.
+    # Problems done by the previous failed run of the command are skipped,
+    # or updated in place if their revision changed since then.
+    # Other problems get ids allocated by the previous run if they are still free,
+    # they are reserved before new ids are allocated
+    contest_config = Config(ejudge_id)
+    allocation_config = contest_config.snapshot()
+    allocations = {}
+    for journal_key in journal_keys:
+        if journal.find(journal_key, contest_config) is None:
+            allocation = journal.find_allocation(journal_key, allocation_config)
+            if allocation is not None:
+                allocations[journal_key] = allocation
+                allocation_config.add_problem(OrderedDict([('id', allocation[1]), ('short_name', allocation[0])]))
+
+    imports = {}
+    for key, journal_key, (problem_id, package) in zip(problem_keys, journal_keys, problem_sources):
+        internal_name = None
+        latest_revision = None
+        entry = journal.find(journal_key, contest_config)
+        if entry is not None:
+            if package is not None:
+                revision = get_package_revision(package)
+            else:
+                revision = latest_revision = get_latest_revision(session, problem_id)
+            if revision == entry['revision']:
+                print('Problem {} is already imported (revision {})'.format(entry['ejudge_problem_id'], revision))
+                continue
+            ejudge_problem_id = entry['ejudge_problem_id']
+            short_name = contest_config.get_problem(ejudge_problem_id)['short_name']
+            internal_name = entry['internal_name']
+        elif journal_key in allocations:
+            short_name, ejudge_problem_id = allocations[journal_key]
+        else:
+            short_name, ejudge_problem_id = allocate_problem_id(allocation_config, key)
+            allocation_config.add_problem(OrderedDict([('id', ejudge_problem_id), ('short_name', short_name)]))
+            journal.allocate(journal_key, ejudge_problem_id, short_name)
+        problem_import = ProblemImport(
+            ejudge_id,
+            problem_id,
+            short_name,
+            ejudge_problem_id,
+            no_offline,
+            internal_name,
+            contest_config=contest_config,
+            package_path=package,
+            latest_revision=latest_revision,
+        )
+        imports[problem_import] = journal_key
+    journal.save()
+
+    def finish(problem_import, completed):
+        if completed:
+            # serve.cfg is written before the problem is added to journal,
+            # so problems from journal are never missing in serve.cfg
+            with contest_lock:
+                contest_config.write()
+            journal.add(
+                imports[problem_import],
+                problem_import.ejudge_problem_id,
+                problem_import.problem_name,
+                problem_import.revision,
+            )
+        elif problem_import.problem_zip_path is not None:
+            problem_import.abort()
+        problem_import.close()
+
+    # Problems go through stages one after another, so downloads, extraction and statement
+    # generation of different problems run at the same time.
+    # serve.cfg is written after every imported problem
+    try:
+        run_pipeline(
+            list(imports),
+            [
+                (ProblemImport.download, jobs or IMPORT_DOWNLOAD_THREADS),
+                (ProblemImport.extract, jobs or IMPORT_EXTRACT_THREADS),
+                (ProblemImport.render, jobs or IMPORT_RENDER_THREADS),
+                (ProblemImport.merge, 1),
+            ],
+            finish,
+            IMPORT_QUEUE_SIZE,
+        )
+        journal.remove()
+    except:
+        print('Run the command again to continue import from the failed problem')
+        raise
+    finally:
+        contest_config.write()
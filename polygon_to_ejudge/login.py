@@ -1,21 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
 import getpass
 import os
+import re
+import threading
+import time
 
-import polygon_cli.config
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
 
-from .config import EJUDGE_URL, LANG_IDS
+from .config import EJUDGE_URL, LANG_IDS, SUBMIT_USE_JSON_API, SUBMIT_THREADS, SUBMIT_RATE_LIMIT, SUBMIT_RETRIES, SUBMIT_BACKOFF, \
+    VERDICT_BATCH_SIZE
+from . import tracing
+from .common import atomic_write, ejudge_auth_file, ejudge_sessions_file
+from .submission_registry import SubmissionRegistry
+
+sessions_file_lock = threading.Lock()
+
+SID_PREFIX = 'name="SID" value="'
+RUN_ID_RE = re.compile(r'run_id=(\d+)')
+# Errors of ejudge JSON API for unknown or expired SID
+EXPIRED_SESSION_ERRORS = {'ERR_INV_SID', 'ERR_INV_SESSION', 'ERR_PERMISSION_DENIED'}
+
+# Short names of ejudge run statuses by their numbers
+RUN_STATUSES = {
+    0: 'OK', 1: 'CE', 2: 'RT', 3: 'TL', 4: 'PE', 5: 'WA', 6: 'CF', 7: 'PT', 8: 'AC', 9: 'IG',
+    10: 'DQ', 11: 'PD', 12: 'ML', 13: 'SE', 14: 'SV', 15: 'WT', 16: 'PR', 17: 'RJ', 18: 'SK',
+    19: 'SY', 20: 'VS', 21: 'VT', 22: 'EM', 23: 'SM', 95: 'FR', 96: 'RU', 97: 'CD', 98: 'CG', 99: 'AV',
+}
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def create_session(pool_size: int) -> requests.Session:
+    # Failed requests are retried with exponential backoff. POST is retried only if connection
+    # could not be established: after server errors and timeouts the submission may be already accepted
+    retry = Retry(
+        total=SUBMIT_RETRIES,
+        backoff_factor=SUBMIT_BACKOFF,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def load_sessions() -> dict:
+    try:
+        with open(ejudge_sessions_file, 'r') as fo:
+            sessions = yaml.load(fo, Loader=yaml.BaseLoader)
+    except (OSError, yaml.YAMLError):
+        return {}
+    return sessions if isinstance(sessions, dict) else {}
+
+
+def save_session(contest_id: int, session_data) -> None:
+    with sessions_file_lock:
+        sessions = load_sessions()
+        if session_data is None:
+            sessions.pop(str(contest_id), None)
+        else:
+            sessions[str(contest_id)] = session_data
+        atomic_write(ejudge_sessions_file, lambda fo: yaml.dump(sessions, fo, default_flow_style=False), mode=0o600)
+
+
+def is_session_expired(page: requests.Response) -> bool:
+    # ejudge shows login form or error page instead of requested page for unknown or expired SID,
+    # JSON API replies with one of EXPIRED_SESSION_ERRORS
+    if 'name="password"' in page.text or 'Invalid session' in page.text:
+        return True
+    if not page.text.lstrip().startswith('{'):
+        return False
+    try:
+        reply = page.json()
+    except ValueError:
+        return False
+    if not isinstance(reply, dict) or reply.get('ok', True):
+        return False
+    error = reply.get('error')
+    return (error.get('symbol') if isinstance(error, dict) else error) in EXPIRED_SESSION_ERRORS
+
+
+class JsonApiUnavailable(Exception):
+    pass
 
-ejudge_auth_file = os.path.join(os.path.expanduser('~'), '.config', 'polygon-to-ejudge', 'auth.yaml')
 
 class EjudgeAuthSession:
-    def __init__(self, contest_id: int):
+    # Solutions found in submission registry are not submitted again unless force is set
+    def __init__(self, contest_id: int, force=False):
+        self.api_token = None
         if os.path.exists(ejudge_auth_file):
             with open(ejudge_auth_file, 'r') as fo:
                 auth_data = yaml.load(fo, Loader=yaml.BaseLoader)
             self.login = auth_data.get('login')
             self.password = auth_data.get('password')
+            self.api_token = auth_data.get('api_token')
         else:
             self.login = input('Ejudge login: ')
             self.password = getpass.getpass('Ejudge password: ')
@@ -28,20 +124,88 @@ class EjudgeAuthSession:
                 yaml.dump(auth_data, fo, default_flow_style=False)
             print('Ejudge authentication data is stored in {}'.format(ejudge_auth_file))
 
-        self.session = requests.session()
+        self.contest_id = contest_id
+        self.session = create_session(SUBMIT_THREADS)
+        self.rate_limiter = RateLimiter(SUBMIT_RATE_LIMIT)
+        self.executor = ThreadPoolExecutor(max_workers=SUBMIT_THREADS)
+        self.pending_submissions = []
+        self.skipped_submissions = []
+        self.registry = SubmissionRegistry(contest_id)
+        self.force = force
+        self.login_lock = threading.Lock()
+        self.use_json_api = SUBMIT_USE_JSON_API
+
         self.serve_control_url = EJUDGE_URL + '/cgi-bin/new-judge'
+        self.judge_url = EJUDGE_URL + 'cgi-bin/new-judge'
+        self.sid = None
+        if self.api_token is not None:
+            # Requests with API token do not need login, SID is only needed for HTML forms
+            self.session.headers['Authorization'] = 'Bearer ' + self.api_token
+            return
+        cached = load_sessions().get(str(contest_id))
+        if isinstance(cached, dict) and cached.get('url') == EJUDGE_URL and cached.get('login') == self.login:
+            self.sid = cached.get('sid')
+            self.session.cookies.update(cached.get('cookies', {}))
+        if not self.sid:
+            self.log_in()
+
+    @tracing.traced('ejudge_login')
+    def log_in(self) -> None:
+        self.session.cookies.clear()
+        self.rate_limiter.wait()
         judge_page = self.session.post(
             self.serve_control_url,
             data={"login": self.login,
                   "password": self.password,
-                  "contest_id": contest_id,
+                  "contest_id": self.contest_id,
                   "role": 1,
                   "language": 0,
                   "action_2": ""
             },
         )
-        pos = judge_page.text.find('name="SID" value="') + len('name="SID" value="')
+        judge_page.raise_for_status()
+        pos = judge_page.text.find(SID_PREFIX)
+        if pos == -1:
+            save_session(self.contest_id, None)
+            raise Exception('Failed to log in to ejudge contest {}'.format(self.contest_id))
+        pos += len(SID_PREFIX)
         self.sid = judge_page.text[pos:pos + 16]
+        save_session(self.contest_id, {
+            'url': EJUDGE_URL,
+            'login': self.login,
+            'sid': self.sid,
+            'cookies': self.session.cookies.get_dict(),
+        })
+
+    def relogin(self, expired_sid: str) -> None:
+        # Only the first thread which found that session expired logs in again
+        with self.login_lock:
+            if self.sid == expired_sid:
+                if expired_sid is None and self.api_token is not None:
+                    raise Exception('Ejudge API token is not accepted')
+                print('Ejudge session expired, logging in again')
+                self.log_in()
+
+    def request(self, method: str, data: dict, **kwargs) -> requests.Response:
+        # Sends request to judge page with current SID, logs in again if session expired
+        for attempt in range(2):
+            sid = self.sid
+            if sid is not None:
+                data = dict(data, SID=sid)
+            else:
+                data = dict(data, contest_id=self.contest_id)
+            self.rate_limiter.wait()
+            if method == 'GET':
+                response = self.session.get(self.judge_url, params=data, **kwargs)
+            else:
+                response = self.session.request(method, self.judge_url, data=data, **kwargs)
+            response.raise_for_status()
+            tracing.count('requests')
+            tracing.count('bytes_received', len(response.content))
+            if not is_session_expired(response):
+                return response
+            self.relogin(sid)
+        raise Exception('Ejudge session expired right after login')
 
     def submit_data(
             self,
@@ -49,10 +213,55 @@ class EjudgeAuthSession:
             lang_id: int,
             problem_id: int,
     ):
-        self.session.post(
-            EJUDGE_URL + 'cgi-bin/new-judge',
-            data={
-                'SID': self.sid,
+        # Returns id of the new run if ejudge reported it
+        if self.use_json_api:
+            try:
+                return self.submit_data_json(data, lang_id, problem_id)
+            except JsonApiUnavailable:
+                if self.use_json_api:
+                    self.use_json_api = False
+                    print('Ejudge JSON API is not available, submitting with HTML forms')
+        return self.submit_data_form(data, lang_id, problem_id)
+
+    def submit_data_json(
+            self,
+            data: str,
+            lang_id: int,
+            problem_id: int,
+    ) -> int:
+        response = self.request(
+            'POST',
+            {
+                'action': 'submit-run',
+                'json': 1,
+                'prob_id': problem_id,
+                'lang_id': lang_id,
+                'eoln_type': 1,
+            },
+            files={'file': data},
+        )
+        try:
+            reply = response.json()
+        except ValueError:
+            # Old ejudge versions answer with HTML page for unknown action
+            raise JsonApiUnavailable()
+        if not reply.get('ok'):
+            raise Exception('ejudge error: {}'.format(reply.get('error')))
+        return int(reply['result']['run_id'])
+
+    def submit_data_form(
+            self,
+            data: str,
+            lang_id: int,
+            problem_id: int,
+    ):
+        if self.sid is None:
+            with self.login_lock:
+                if self.sid is None:
+                    self.log_in()
+        response = self.request(
+            'POST',
+            {
                 'problem': str(problem_id),
                 'eoln_type': '1',
                 'lang_id': lang_id,
@@ -61,6 +270,47 @@ class EjudgeAuthSession:
             files={'file': data},
             allow_redirects=True
         )
+        # Only the redirect after submission points to the new run, run ids on the page may belong to other runs
+        for page in response.history + [response]:
+            match = RUN_ID_RE.search(page.url)
+            if match:
+                return int(match.group(1))
+        return None
+
+    def get_run_statuses(self, run_ids: list) -> dict:
+        # Statuses are requested for ranges of consecutive run ids, not for every run
+        run_ids = sorted(run_ids)
+        statuses = {}
+        i = 0
+        while i < len(run_ids):
+            j = i
+            while j + 1 < len(run_ids) and run_ids[j + 1] - run_ids[i] < VERDICT_BATCH_SIZE:
+                j += 1
+            if i == j:
+                response = self.request('GET', {
+                    'action': 'run-status-json',
+                    'json': 1,
+                    'run_id': run_ids[i],
+                })
+            else:
+                response = self.request('GET', {
+                    'action': 'list-runs-json',
+                    'json': 1,
+                    'filter_first_run': run_ids[i],
+                    'filter_last_run': run_ids[j],
+                })
+            reply = response.json()
+            if not reply.get('ok'):
+                raise Exception('Failed to get run statuses: {}'.format(reply.get('error')))
+            if i == j:
+                runs = [reply['result'].get('run', reply['result'])]
+            else:
+                runs = reply['result'].get('runs', [])
+            for run in runs:
+                status = run.get('status_str', run.get('status'))
+                statuses[int(run['run_id'])] = RUN_STATUSES.get(status, str(status))
+            i = j + 1
+        return {run_id: statuses[run_id] for run_id in run_ids if run_id in statuses}
 
     def submit_file(
             self,
@@ -103,26 +353,39 @@ class EjudgeAuthSession:
 
         lang_ids = LANG_IDS[lang_type]
         for lang_id in lang_ids:
-            self.submit_data(data, lang_id, problem_id)
-
-
-def logout():
-    # TODO: chose login
-    try:
-        os.remove(polygon_cli.config.authentication_file)
-    except:
-        pass
-
-    try:
-        os.remove(ejudge_auth_file)
-    except:
-        pass
-    polygon_cli.config.login = None
-
+            run = {
+                'problem_id': problem_id,
+                'lang_id': lang_id,
+                'solution_path': solution_path,
+            }
+            submitted = self.registry.find(problem_id, lang_id, data)
+            if submitted is not None and not self.force:
+                run['run_id'] = submitted['run_id']
+                self.skipped_submissions.append(run)
+                continue
+            self.pending_submissions.append(
+                (run, data, self.executor.submit(tracing.bind(self.submit_data), data, lang_id, problem_id))
+            )
 
-def add_subparsers(subparsers):
-    parser_logout = subparsers.add_parser(
-        'logout',
-        help="Log out of your login in ejudge and polygon"
-    )
-    parser_logout.set_defaults(func=lambda options: logout())
+    @tracing.traced('submit_wait')
+    def wait(self) -> list:
+        # Waits for all submissions started by submit_file, raises if any of them failed.
+        # Returns submitted and skipped runs, run_id is None if ejudge did not report it
+        failed = 0
+        runs = self.skipped_submissions
+        if len(runs) > 0:
+            print('Skipped {} already submitted solutions'.format(len(runs)))
+        for run, data, future in self.pending_submissions:
+            try:
+                run['run_id'] = future.result()
+                runs.append(run)
+                self.registry.add(run['problem_id'], run['lang_id'], data, run['run_id'])
+            except Exception as e:
+                print('Failed to submit {}: {}'.format(run['solution_path'], e))
+                failed += 1
+        self.pending_submissions = []
+        self.skipped_submissions = []
+        self.registry.save()
+        if failed > 0:
+            raise Exception('Failed to submit {} solutions'.format(failed))
+        return runs
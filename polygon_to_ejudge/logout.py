@@ -0,0 +1,15 @@
+import os
+
+from .common import ejudge_auth_file, ejudge_sessions_file
+
+# Same path as in polygon_cli.config.setup_login_by_url, polygon_cli is not imported to keep logout fast
+polygon_auth_file = os.path.join(os.path.expanduser('~'), '.config', 'polygon-cli', 'auth.yaml')
+
+
+def logout():
+    # TODO: chose login
+    for path in [polygon_auth_file, ejudge_auth_file, ejudge_sessions_file]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,245 @@
+import os
+import re
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+from polygon_cli.polygon_html_parsers import PackageParser
+
+from . import tracing
+from .config import PACKAGE_CACHE_SIZE
+
+# Cached packages are stored in contest download folder as <polygon id>-r<revision>-<problem name>.zip
+PACKAGE_NAME_RE = re.compile(r'^(\d+)-r(\d+)-(.+)\.zip$')
+
+cache_lock = threading.Lock()
+used_packages = {}
+
+
+def get_partial_package_path(download_dir: str, polygon_id: int, revision: int) -> str:
+    return os.path.join(download_dir, '{}-r{}.zip.part'.format(polygon_id, revision))
+
+
+def get_validator_path(part_path: str) -> str:
+    # ETag or Last-Modified of the file which is downloaded to part_path
+    return part_path + '.validator'
+
+
+def remove_partial_packages(download_dir: str, polygon_id: int) -> None:
+    prefix = '{}-r'.format(polygon_id)
+    for file_name in os.listdir(download_dir):
+        if file_name.startswith(prefix) and file_name.endswith(('.zip.part', '.zip.part.validator')):
+            os.remove(os.path.join(download_dir, file_name))
+
+
+def save_validator(validator_path: str, headers) -> None:
+    # Weak ETag can not be used in If-Range
+    validator = headers.get('ETag')
+    if validator is None or validator.startswith('W/'):
+        validator = headers.get('Last-Modified')
+    if validator is None:
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        return
+    with open(validator_path, 'w') as f:
+        f.write(validator)
+
+
+def download_to_file(session, link: str, part_path: str) -> None:
+    # Download continues from the end of partially downloaded file, if server supports ranges
+    # and the file was not changed since the download started. Otherwise it starts from the beginning
+    validator_path = get_validator_path(part_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset > 0 and os.path.exists(validator_path):
+        with open(validator_path, 'r') as f:
+            validator = f.read().strip()
+    headers = {'Range': 'bytes={}-'.format(offset), 'If-Range': validator} if validator else {}
+    r = session.send_request('GET', link, stream=True, headers=headers)
+    if r.status_code == 416:
+        # Partial file is longer than the file on server, so it is not a part of it
+        r.close()
+        r = session.send_request('GET', link, stream=True)
+    if r.status_code != 206:
+        offset = 0
+    if r.status_code not in (200, 206):
+        raise Exception('Failed to download package: HTTP {}'.format(r.status_code))
+    if offset > 0:
+        print('Resuming download from {} bytes'.format(offset))
+        total_size = r.headers.get('Content-Range', '').split('/')[-1]
+        expected_size = offset + int(r.headers['Content-Length']) if 'Content-Length' in r.headers else None
+        if total_size.isdigit():
+            expected_size = int(total_size)
+    else:
+        expected_size = int(r.headers['Content-Length']) if 'Content-Length' in r.headers else None
+        save_validator(validator_path, r.headers)
+    with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+        for c in r.iter_content(64 * 1024):
+            if c:
+                f.write(c)
+                tracing.count('bytes_downloaded', len(c))
+    if expected_size is not None and os.path.getsize(part_path) != expected_size:
+        raise Exception('Package download was interrupted, it will be resumed on the next run')
+    if os.path.exists(validator_path):
+        os.remove(validator_path)
+
+
+def download_last_package(session, download_dir, revision=None):
+    # Same as ProblemSession.download_last_package, but saves package to download_dir
+    # instead of current working directory. If revision is known, partially downloaded
+    # package is kept and its download is resumed on the next call.
+    # Returns downloaded file, which is named by polygon id of the problem, and short name of the problem
+    url = session.make_link('package', ssid=True, ccid=True)
+    data = session.send_request('GET', url).text
+    parser = PackageParser()
+    parser.feed(data)
+    if parser.url is None:
+        raise Exception('No package created for problem {}'.format(session.problem_id))
+    link = session.make_link(parser.url, ssid=True, ccid=False)
+    filename = parser.url
+    filename = filename[:filename.find('.zip')]
+    filename = filename[filename.rfind('/') + 1:]
+    filename = filename[:filename.rfind('-')]
+
+    if revision is not None:
+        part_path = get_partial_package_path(download_dir, session.problem_id, revision)
+        download_to_file(session, link, part_path)
+        if not zipfile.is_zipfile(part_path):
+            os.remove(part_path)
+            raise Exception('Downloaded package of problem {} is broken'.format(session.problem_id))
+        return part_path, filename
+
+    fd, tmp_path = tempfile.mkstemp(dir=download_dir, prefix='{}-'.format(session.problem_id), suffix='.tmp')
+    os.close(fd)
+    try:
+        download_to_file(session, link, tmp_path)
+    except:
+        os.remove(tmp_path)
+        if os.path.exists(get_validator_path(tmp_path)):
+            os.remove(get_validator_path(tmp_path))
+        raise
+    return tmp_path, filename
+
+
+def get_latest_revision(session, polygon_id: int):
+    # Revision decides whether a problem is downloaded and updated, so it is never taken from API cache,
+    # otherwise package built in polygon just now would not be seen
+    problems = session.send_api_request('problems.list', {'id': polygon_id}, problem_data=False)
+    for problem_info in problems:
+        if int(problem_info['id']) == int(polygon_id) and 'latestPackage' in problem_info:
+            return int(problem_info['latestPackage'])
+    return None
+
+
+def get_package_revision(package_path: str) -> int:
+    with zipfile.ZipFile(package_path, 'r') as zip_file:
+        with zip_file.open('problem.xml') as xml_file:
+            return int(ET.parse(xml_file).getroot().attrib['revision'])
+
+
+def find_cached_package(download_dir: str, polygon_id: int, revision: int):
+    if not os.path.isdir(download_dir):
+        return None
+    for file_name in os.listdir(download_dir):
+        match = PACKAGE_NAME_RE.match(file_name)
+        if match and int(match.group(1)) == int(polygon_id) and int(match.group(2)) == int(revision):
+            return os.path.join(download_dir, file_name)
+    return None
+
+
+def get_package(session, polygon_id: int, download_dir: str, revision=None) -> str:
+    # Package is downloaded only if there is no package with the same revision in download_dir.
+    # Returned package is not evicted until release_package is called.
+    if revision is None:
+        revision = get_latest_revision(session, polygon_id)
+
+    package_path = None
+    if revision is not None:
+        with cache_lock:
+            package_path = find_cached_package(download_dir, polygon_id, revision)
+            if package_path:
+                use_package(package_path)
+
+    if package_path is None:
+        # Downloaded file is moved straight to its name in cache, so problems with the same
+        # short name downloaded at the same time do not overwrite each other
+        downloaded_path, problem_name = download_last_package(session, download_dir, revision)
+        try:
+            revision = get_package_revision(downloaded_path)
+        except:
+            os.remove(downloaded_path)
+            raise
+        package_path = os.path.join(
+            download_dir,
+            '{}-r{}-{}.zip'.format(polygon_id, revision, problem_name),
+        )
+        with cache_lock:
+            os.replace(downloaded_path, package_path)
+            use_package(package_path)
+            evict_packages(download_dir)
+        remove_partial_packages(download_dir, polygon_id)
+    else:
+        print('Using cached package {}'.format(package_path))
+
+    return package_path
+
+
+def get_package_problem_name(package_path: str) -> str:
+    match = PACKAGE_NAME_RE.match(os.path.basename(package_path))
+    if match:
+        return match.group(3)
+    # Packages that are not from cache are named by short name of the problem
+    with zipfile.ZipFile(package_path, 'r') as zip_file:
+        with zip_file.open('problem.xml') as xml_file:
+            short_name = ET.parse(xml_file).getroot().attrib.get('short-name')
+    return short_name or os.path.basename(package_path)[:-len('.zip')]
+
+
+def get_package_polygon_id(package_path: str):
+    match = PACKAGE_NAME_RE.match(os.path.basename(package_path))
+    return int(match.group(1)) if match else None
+
+
+def get_local_packages(path: str) -> list:
+    if os.path.isdir(path):
+        return [
+            os.path.join(path, file_name)
+            for file_name in sorted(os.listdir(path))
+            if file_name.endswith('.zip')
+        ]
+    return [path]
+
+
+def use_package(package_path: str) -> None:
+    used_packages[package_path] = used_packages.get(package_path, 0) + 1
+    os.utime(package_path)
+
+
+def release_package(package_path: str) -> None:
+    with cache_lock:
+        used_packages[package_path] -= 1
+        if used_packages[package_path] == 0:
+            used_packages.pop(package_path)
+
+
+def evict_packages(download_dir: str, max_size=PACKAGE_CACHE_SIZE) -> None:
+    # Least recently used packages are removed first, packages that are in use are never removed
+    packages = []
+    total_size = 0
+    for file_name in os.listdir(download_dir):
+        if not PACKAGE_NAME_RE.match(file_name):
+            continue
+        package_path = os.path.join(download_dir, file_name)
+        stat = os.stat(package_path)
+        packages.append((stat.st_mtime, stat.st_size, package_path))
+        total_size += stat.st_size
+
+    packages.sort()
+    for mtime, size, package_path in packages:
+        if total_size <= max_size:
+            break
+        if package_path in used_packages:
+            continue
+        os.remove(package_path)
+        total_size -= size
@@ -0,0 +1,74 @@
+import queue
+import threading
+
+from . import tracing
+
+# Items are passed through stages, every stage has its own threads and a bounded queue of items
+# waiting for it, so all stages work at the same time and a slow stage holds back the previous
+# ones only when its queue is full.
+# Stages are given as (function, threads). When a stage fails on an item, the remaining items
+# are not started, items in progress go through all stages.
+# finish(item, completed) is called once for every started item, when it leaves the pipeline.
+
+STOP = object()
+
+
+def run_pipeline(items, stages, finish, queue_size=1) -> None:
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for stage in stages]
+    errors = []
+    errors_lock = threading.Lock()
+    failed = threading.Event()
+
+    def fail(error):
+        with errors_lock:
+            errors.append(error)
+        failed.set()
+
+    def finish_item(item, completed):
+        # Worker must keep reading its queue even if finish fails, otherwise the pipeline never stops
+        try:
+            finish(item, completed)
+        except Exception as e:
+            fail(e)
+
+    def work(stage_index):
+        function, threads = stages[stage_index]
+        while True:
+            item = queues[stage_index].get()
+            if item is STOP:
+                return
+            try:
+                function(item)
+            except Exception as e:
+                fail(e)
+                finish_item(item, False)
+                continue
+            if stage_index + 1 < len(stages):
+                queues[stage_index + 1].put(item)
+            else:
+                finish_item(item, True)
+
+    workers = []
+    for stage_index, (function, threads) in enumerate(stages):
+        stage_workers = [
+            threading.Thread(target=tracing.bind(work), args=(stage_index,), daemon=True)
+            for i in range(max(1, threads))
+        ]
+        for worker in stage_workers:
+            worker.start()
+        workers.append(stage_workers)
+
+    for item in items:
+        if failed.is_set():
+            break
+        queues[0].put(item)
+
+    # Stages are stopped in order, so every stage gets all items of the previous one
+    for stage_index, stage_workers in enumerate(workers):
+        for worker in stage_workers:
+            queues[stage_index].put(STOP)
+        for worker in stage_workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from polygon_cli import problem
+from polygon_cli import config as cli_config
+from polygon_cli.polygon_html_parsers import ExtractSessionParser
+from polygon_cli.exceptions import ProblemNotFoundError
+from requests.adapters import HTTPAdapter
+
+from .common import atomic_write
+from .config import POLYGON_API_CACHE_TTL, IMPORT_DOWNLOAD_THREADS, PREFETCH_THREADS
+
+# One polygon session is used by the whole process: login is done once and its cookies
+# and connections are shared by sessions of all problems.
+# Responses of read-only API methods that do not decide what to download or update
+# (lists of contest problems) are cached on disk for POLYGON_API_CACHE_TTL seconds.
+api_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'polygon-to-ejudge', 'api')
+use_api_cache = True
+
+shared_session = None
+session_lock = threading.Lock()
+login_lock = threading.Lock()
+
+
+class SharedProblemSession(problem.ProblemSession):
+    # Session of one problem, which logs in through the shared session
+    def __init__(self, polygon_id: int, shared):
+        super().__init__('main', polygon_id, None)
+        self.shared = shared
+        self.session = shared.session
+        self.ccid = shared.ccid
+        self.renewing = False
+
+    def renew_http_data(self):
+        # ProblemSession calls it to get session of the problem for the first time, and after polygon
+        # redirected a request to login page. Only in the second case ccid has expired and login is repeated
+        if self.sessionId is None and not self.renewing:
+            self.ccid = login(self.shared)
+        else:
+            self.relogin_done = True
+            self.ccid = login(self.shared, self.ccid)
+        self.renewing = True
+        try:
+            links = self.get_problem_links()
+            if links['start'] is None and links['continue'] is None:
+                raise ProblemNotFoundError()
+            url = self.make_link(links['continue'] or links['start'])
+            problem_page = self.send_request('GET', url).text
+        finally:
+            self.renewing = False
+        parser = ExtractSessionParser()
+        parser.feed(problem_page)
+        self.sessionId = parser.session
+
+
+def login(shared, expired_ccid=None) -> str:
+    # Login is repeated only if ccid that was used has expired and nobody logged in since then
+    with login_lock:
+        if shared.ccid is None or shared.ccid == expired_ccid:
+            problem.get_login_password()
+            shared.login(cli_config.login, cli_config.password)
+        return shared.ccid
+
+
+def get_polygon_session():
+    # Session for API requests which are not related to one problem
+    global shared_session
+    with session_lock:
+        if shared_session is None:
+            cli_config.setup_login_by_url('')
+            shared_session = problem.ProblemSession(cli_config.polygon_url, None, None)
+            adapter = HTTPAdapter(pool_maxsize=max(IMPORT_DOWNLOAD_THREADS, PREFETCH_THREADS))
+            shared_session.session.mount('http://', adapter)
+            shared_session.session.mount('https://', adapter)
+        return shared_session
+
+
+def get_problem_session(polygon_id: int):
+    return SharedProblemSession(polygon_id, get_polygon_session())
+
+
+def get_api_cache_path(api_method: str, params: dict) -> str:
+    key = json.dumps([cli_config.polygon_url, api_method, params], sort_keys=True)
+    return os.path.join(api_cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def send_cached_api_request(session, api_method: str, params: dict):
+    # Only for methods which do not change anything in polygon
+    cache_path = get_api_cache_path(api_method, params)
+    if use_api_cache and POLYGON_API_CACHE_TTL > 0:
+        try:
+            with open(cache_path, 'r') as cache_file:
+                cached = json.load(cache_file)
+            if time.time() - cached['time'] < POLYGON_API_CACHE_TTL:
+                return cached['result']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # send_api_request adds signature to params, so it gets a copy
+    result = session.send_api_request(api_method, dict(params), problem_data=False)
+
+    os.makedirs(api_cache_dir, exist_ok=True)
+    cached = {'time': time.time(), 'result': result}
+    atomic_write(cache_path, lambda cache_file: json.dump(cached, cache_file), mode=0o600)
+    return result
@@ -1,15 +1,165 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import importlib
 from sys import argv
 
-from . import import_problem
-from . import remove_problem
-from . import update_problem
-from . import submit_problem
-from . import login
+from .config import PREFETCH_THREADS
+
+
+def argument(*args, **kwargs):
+    return args, kwargs
+
+
+# Subcommands are described here instead of their modules, so that a module and its dependencies
+# (bs4, requests, yaml, polygon_cli) are imported only when its subcommand is run.
+# function is "<module>.<function>", arguments are passed to add_argument and call runs
+# the function with parsed options.
+SUBCOMMANDS = [
+    {
+        'name': 'ip',
+        'help': "Import single problem from polygon",
+        'function': 'import_problem.import_problem',
+        'arguments': [
+            argument('contest_id', help='Id of ejudge contest to add problem', type=int),
+            argument('problem_id', help='Polygon id for the problem', type=int, nargs='?', default=None),
+            argument('-short', help="Short name for the problem", default=None, type=str),
+            argument('-ej_id', help="Ejudge id for the problem", default=None, type=int),
+            argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true"),
+            argument('-p', "--package", help="Import local package zip instead of downloading it", default=None),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.problem_id, options.short,
+                                                   options.ej_id, options.no_offline, package_path=options.package),
+    },
+    {
+        'name': 'ic',
+        'help': "Import contest from polygon to ejudge",
+        'function': 'import_problem.import_contest',
+        'arguments': [
+            argument('ejudge_id', help='Ejudge contest id', type=int),
+            argument('polygon_id', help='Polygon contest id', type=int, nargs='?', default=None),
+            argument("-n", "--no-offline", help="Ignore offline groups in valuer", action="store_true"),
+            argument("-j", "--jobs", help="Number of threads of every import stage", default=None, type=int),
+            argument("-p", "--package",
+                     help="Import local package zip or directory of zips instead of polygon contest"),
+        ],
+        'call': lambda function, options: function(options.ejudge_id, options.polygon_id, options.no_offline,
+                                                   options.jobs, options.package),
+    },
+    {
+        'name': 'rp',
+        'help': "Remove single problem",
+        'function': 'remove_problem.remove_problem',
+        'arguments': [
+            argument('contest_id', help='Id of contest in ejudge to remove problem', type=int),
+            argument('problem_id', help='Problem id in ejudge', type=int),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.problem_id),
+    },
+    {
+        'name': 'rc',
+        'help': "Remove all problems from contest",
+        'function': 'remove_problem.remove_contest',
+        'arguments': [
+            argument('contest_id', help='Id of contest in ejudge to remove', type=int),
+        ],
+        'call': lambda function, options: function(options.contest_id),
+    },
+    {
+        'name': 'up',
+        'help': "Update single problem",
+        'function': 'update_problem.update_problem',
+        'arguments': [
+            argument('contest_id', help='Id of contest in ejudge', type=int),
+            argument('problem_id', help='Problem id in ejudge', type=int),
+            argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true"),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.problem_id, options.no_offline),
+    },
+    {
+        'name': 'rollback',
+        'help': "Restore problem files before the last update",
+        'function': 'update_problem.rollback_problem',
+        'arguments': [
+            argument('contest_id', help='Id of contest in ejudge', type=int),
+            argument('problem_id', help='Problem id in ejudge', type=int),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.problem_id),
+    },
+    {
+        'name': 'uc',
+        'help': "Update each problem in ejudge contest",
+        'function': 'update_problem.update_contest',
+        'arguments': [
+            argument('contest_id', help='Ejudge contest id', type=int),
+            argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true"),
+            argument('-f', "--force", help="Update problems with unchanged polygon revision too", action="store_true"),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.no_offline, options.force),
+    },
+    {
+        'name': 'prefetch',
+        'help': "Download latest packages of contest problems to use them in ic and uc later",
+        'function': 'prefetch.prefetch_contest',
+        'arguments': [
+            argument('ejudge_id', help='Id of contest in ejudge', type=int),
+            argument('polygon_id', nargs='?', default=None, type=int,
+                     help='Id of contest in polygon, problems of ejudge contest are used if not given'),
+            argument("-j", "--jobs", help="Number of packages downloaded in parallel",
+                     default=PREFETCH_THREADS, type=int),
+        ],
+        'call': lambda function, options: function(options.ejudge_id, options.polygon_id, options.jobs),
+    },
+    {
+        'name': 'sp',
+        'help': "Submit solutions for single problem",
+        'function': 'submit_problem.submit_problem',
+        'arguments': [
+            argument('contest_id', help='Id of ejudge contest to submit solutions', type=int),
+            argument('problem_id', help='Id of problem in contest to submit solutions', type=int),
+            argument('-m', "--only-main", help="Submit only main correct solution", action="store_true"),
+            argument('-n', "--no-lint", help="Modify solutions to be ignored by linter", action="store_true"),
+            argument('-w', "--wait", help="Wait for verdicts and compare them with Polygon tags", action="store_true"),
+            argument('-f', "--force", help="Submit solutions which were already submitted", action="store_true"),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.problem_id, options.only_main,
+                                                   options.no_lint, wait_verdicts=options.wait, force=options.force),
+    },
+    {
+        'name': 'sc',
+        'help': "Submit solutions for all problems in contest",
+        'function': 'submit_problem.submit_contest',
+        'arguments': [
+            argument('contest_id', help='Id of contest in ejudge to submit solutions', type=int),
+            argument('-m', "--only-main", help="Submit only main correct solution", action="store_true"),
+            argument('-n', "--no-lint", help="Modify solutions to be ignored by linter", action="store_true"),
+            argument('-w', "--wait", help="Wait for verdicts and compare them with Polygon tags", action="store_true"),
+            argument('-f', "--force", help="Submit solutions which were already submitted", action="store_true"),
+        ],
+        'call': lambda function, options: function(options.contest_id, options.only_main, options.no_lint,
+                                                   options.wait, options.force),
+    },
+    {
+        'name': 'logout',
+        'help': "Log out of your login in ejudge and polygon",
+        'function': 'logout.logout',
+        'arguments': [],
+        'call': lambda function, options: function(),
+    },
+]
+
+
+def run_subcommand(subcommand, options):
+    module_name, function_name = subcommand['function'].rsplit('.', 1)
+    module = importlib.import_module('.' + module_name, __package__)
+    subcommand['call'](getattr(module, function_name), options)
+
 
 parser = argparse.ArgumentParser()
+parser.add_argument('--trace', help='Write timings of import phases to file in Chrome trace format', metavar='FILE')
+parser.add_argument('--profile', help='Write cProfile stats of the subcommand to file', metavar='FILE')
+parser.add_argument('--no-api-cache', help='Do not use cached responses of polygon API', action='store_true')
 subparsers = parser.add_subparsers(
         title='available subcommands',
         description='',
@@ -19,17 +169,38 @@ subparsers = parser.add_subparsers(
 
 subparsers.required = True
 
-import_problem.add_subparsers(subparsers)
-remove_problem.add_subparsers(subparsers)
-update_problem.add_subparsers(subparsers)
-submit_problem.add_subparsers(subparsers)
-login.add_subparsers(subparsers)
+for subcommand in SUBCOMMANDS:
+    subparser = subparsers.add_parser(subcommand['name'], help=subcommand['help'])
+    for args, kwargs in subcommand['arguments']:
+        subparser.add_argument(*args, **kwargs)
+    subparser.set_defaults(func=functools.partial(run_subcommand, subcommand))
 
 
 def main():
     options = parser.parse_args(argv[1:])
-    options.func(options)
+    # Modules used by options are imported only when options are given, like subcommand modules
+    if options.trace:
+        from . import tracing
+        tracing.enable()
+    if options.no_api_cache:
+        from . import polygon_session
+        polygon_session.use_api_cache = False
+    profiler = None
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        options.func(options)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(options.profile)
+            print('Profile is written to {}'.format(options.profile))
+        if options.trace:
+            tracing.dump(options.trace)
+            print('Trace is written to {}'.format(options.trace))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from . import polygon_session
+from . import tracing
+from .common import Config, get_ejudge_contest_dir
+from .config import PREFETCH_THREADS
+from .package_cache import get_package, release_package
+
+
+def get_contest_polygon_ids(ejudge_id: int) -> list:
+    polygon_ids = []
+    for problem_config in Config(ejudge_id).problems:
+        extid = problem_config.get('extid')
+        if isinstance(extid, str) and extid.startswith('polygon'):
+            polygon_ids.append(int(extid[extid.find(':') + 1:]))
+    return polygon_ids
+
+
+def prefetch_problem(download_dir: str, polygon_id: int) -> None:
+    session = polygon_session.get_problem_session(polygon_id)
+    package_path = get_package(session, polygon_id, download_dir)
+    release_package(package_path)
+
+
+@tracing.traced('prefetch_contest', 'ejudge_id', 'polygon_id')
+def prefetch_contest(
+        ejudge_id: int,
+        polygon_id=None,
+        jobs=PREFETCH_THREADS,
+) -> None:
+    # Latest packages are downloaded to contest download folder, so that ic and uc only use
+    # cached packages. Without polygon_id, packages of problems already imported to contest are downloaded
+    download_dir = os.path.join(get_ejudge_contest_dir(ejudge_id), 'download')
+    os.makedirs(download_dir, exist_ok=True)
+
+    if polygon_id is not None:
+        session = polygon_session.get_polygon_session()
+        problems = polygon_session.send_cached_api_request(session, 'contest.problems', {'contestId': polygon_id})
+        polygon_ids = [problems[key]['id'] for key in sorted(problems.keys())]
+    else:
+        polygon_ids = get_contest_polygon_ids(ejudge_id)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(tracing.bind(prefetch_problem), download_dir, problem_id)
+            for problem_id in polygon_ids
+        ]
+        for problem_id, future in zip(polygon_ids, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print('Failed to prefetch problem {}: {}'.format(problem_id, e))
+                failed += 1
+    if failed > 0:
+        raise Exception('Failed to prefetch {} of {} problems'.format(failed, len(polygon_ids)))
+    print('Prefetched {} problems'.format(len(polygon_ids)))
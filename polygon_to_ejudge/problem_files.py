@@ -0,0 +1,208 @@
+import ctypes
+import json
+import os
+import shutil
+import threading
+
+from . import tracing
+from .blob_store import add_blob, link_blob, collect_garbage
+from .common import atomic_write
+
+MANIFEST_FILE_NAME = '.package_manifest.json'
+
+# renameat2 arguments to swap two paths atomically, see man 2 rename
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+def has_manifest(problem_dir: str) -> bool:
+    return os.path.exists(os.path.join(problem_dir, MANIFEST_FILE_NAME))
+
+
+def load_manifest(problem_dir: str) -> dict:
+    manifest_path = os.path.join(problem_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def get_stored_digests(manifest: dict) -> list:
+    # Entries of files linked from test store have content digest as the fourth element
+    return [entry[3] for entry in manifest.values() if len(entry) > 3]
+
+
+def remove_problem_dir(problem_dir: str) -> None:
+    digests = get_stored_digests(load_manifest(problem_dir))
+    shutil.rmtree(problem_dir)
+    collect_garbage(digests)
+
+
+# Updated problem is built in staging folder next to problem folder and then swapped with it,
+# previous version of the problem is kept in backup folder for rollback
+def get_staging_dir(problem_dir: str) -> str:
+    return os.path.join(os.path.dirname(problem_dir), '.{}.staging'.format(os.path.basename(problem_dir)))
+
+
+def get_backup_dir(problem_dir: str) -> str:
+    return os.path.join(os.path.dirname(problem_dir), '.{}.old'.format(os.path.basename(problem_dir)))
+
+
+def create_staging_dir(problem_dir: str) -> str:
+    # Staging folder starts as a copy of problem folder, so that unchanged files are not
+    # extracted again. Tests are hardlinked, they are only replaced and never changed in place
+    staging_dir = get_staging_dir(problem_dir)
+    if os.path.exists(staging_dir):
+        remove_problem_dir(staging_dir)
+    os.mkdir(staging_dir)
+    if not has_manifest(problem_dir):
+        return staging_dir
+    for root, dirs, files in os.walk(problem_dir):
+        relative_root = os.path.relpath(root, problem_dir)
+        for dir_name in dirs:
+            os.mkdir(os.path.join(staging_dir, relative_root, dir_name))
+        for file_name in files:
+            src = os.path.join(root, file_name)
+            dst = os.path.join(staging_dir, relative_root, file_name)
+            if relative_root.split(os.sep)[0] == 'tests':
+                os.link(src, dst)
+            else:
+                shutil.copy2(src, dst)
+    return staging_dir
+
+
+def exchange_dirs(first_dir: str, second_dir: str) -> bool:
+    # Returns False if atomic exchange is not supported by system or file system
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    result = renameat2(AT_FDCWD, os.fsencode(first_dir), AT_FDCWD, os.fsencode(second_dir), RENAME_EXCHANGE)
+    return result == 0
+
+
+def swap_problem_dir(staging_dir: str, problem_dir: str) -> None:
+    backup_dir = get_backup_dir(problem_dir)
+    if os.path.exists(backup_dir):
+        remove_problem_dir(backup_dir)
+    if exchange_dirs(staging_dir, problem_dir):
+        os.rename(staging_dir, backup_dir)
+    else:
+        os.rename(problem_dir, backup_dir)
+        os.rename(staging_dir, problem_dir)
+
+
+def rollback_problem_dir(problem_dir: str) -> None:
+    # Previous version of the problem becomes current and current one is kept as backup
+    backup_dir = get_backup_dir(problem_dir)
+    if not exchange_dirs(backup_dir, problem_dir):
+        # Staging folder is used as a temporary name, the one left by an interrupted update is removed first
+        staging_dir = get_staging_dir(problem_dir)
+        if os.path.exists(staging_dir):
+            remove_problem_dir(staging_dir)
+        os.rename(problem_dir, staging_dir)
+        os.rename(backup_dir, problem_dir)
+        os.rename(staging_dir, backup_dir)
+
+
+class ProblemFiles:
+    # Writes files from polygon package to problem folder. For every written file
+    # CRC32 and size from the package are stored in manifest, so on the next import
+    # files with the same content are not written again, and files that are not in
+    # the new package are removed.
+    def __init__(self, problem_dir: str):
+        self.problem_dir = problem_dir
+        self.old_manifest = load_manifest(problem_dir)
+        self.manifest = {}
+        self.written_files = 0
+        self.skipped_files = 0
+        self.lock = threading.Lock()
+
+    def get_path(self, file_name: str) -> str:
+        file_name = os.path.normpath(file_name)
+        if os.path.isabs(file_name) or file_name.startswith('..'):
+            raise Exception('Bad file name in package: {}'.format(file_name))
+        return os.path.join(self.problem_dir, file_name)
+
+    def is_unchanged(self, file_name: str, crc: int, size: int) -> bool:
+        old_entry = self.old_manifest.get(file_name)
+        if old_entry is None or old_entry[0] != crc or old_entry[1] != size:
+            return False
+        try:
+            stat = os.stat(self.get_path(file_name))
+        except OSError:
+            return False
+        # Files from the package are not changed by import, but they could be edited in problem folder by hand
+        return stat.st_size == size and stat.st_mtime_ns == old_entry[2]
+
+    def add_entry(self, file_name: str, crc: int, size: int, written: bool, digest=None) -> None:
+        stat = os.stat(self.get_path(file_name))
+        entry = [crc, size, stat.st_mtime_ns]
+        if digest is not None:
+            entry.append(digest)
+        with self.lock:
+            self.manifest[file_name] = entry
+            if written:
+                self.written_files += 1
+            else:
+                self.skipped_files += 1
+
+    def write(self, file_name: str, src) -> None:
+        # File is replaced instead of being overwritten in place, so hardlinks to it are not changed
+        path = self.get_path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, lambda f: shutil.copyfileobj(src, f, 1024 * 1024), binary=True)
+
+    def extract(self, zip_file, zip_info, file_name: str, stored=False) -> None:
+        # If stored is True, file is written to test store and hardlinked to problem folder
+        if zip_info.is_dir():
+            os.makedirs(self.get_path(file_name), exist_ok=True)
+            return
+        if self.is_unchanged(file_name, zip_info.CRC, zip_info.file_size):
+            old_entry = self.old_manifest[file_name]
+            digest = old_entry[3] if len(old_entry) > 3 else None
+            self.add_entry(file_name, zip_info.CRC, zip_info.file_size, False, digest)
+            return
+
+        digest = None
+        if stored:
+            path = self.get_path(file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                digest = add_blob(zip_file, zip_info)
+                link_blob(digest, path)
+            except OSError as e:
+                print('Failed to link {} from test store: {}'.format(file_name, e))
+                digest = None
+        if digest is None:
+            with zip_file.open(zip_info) as src:
+                self.write(file_name, src)
+        self.add_entry(file_name, zip_info.CRC, zip_info.file_size, True, digest)
+        tracing.count('bytes_extracted', zip_info.file_size)
+
+    def remove(self) -> None:
+        digests = get_stored_digests(self.old_manifest) + get_stored_digests(self.manifest)
+        shutil.rmtree(self.problem_dir)
+        collect_garbage(digests)
+
+    def finish(self) -> None:
+        removed_files = 0
+        for file_name in self.old_manifest:
+            if file_name not in self.manifest and os.path.exists(self.get_path(file_name)):
+                os.remove(self.get_path(file_name))
+                removed_files += 1
+
+        with open(os.path.join(self.problem_dir, MANIFEST_FILE_NAME), 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file)
+
+        digests = set(get_stored_digests(self.manifest))
+        collect_garbage([
+            digest for digest in get_stored_digests(self.old_manifest) if digest not in digests
+        ])
+
+        if self.old_manifest:
+            print('Files written: {}, unchanged: {}, removed: {}'.format(
+                self.written_files,
+                self.skipped_files,
+                removed_files,
+            ))
@@ -1,59 +1,43 @@
 import os
 import shutil
 
+from . import tracing
 from .common import Config, get_ejudge_contest_dir
+from .problem_files import remove_problem_dir, get_staging_dir, get_backup_dir
 
 
+@tracing.traced('remove_problem', 'ejudge_contest_id', 'ejudge_problem_id')
 def remove_problem(
         ejudge_contest_id: int,
         ejudge_problem_id: int,
-        keep_config=False,
 ) -> None:
     contest_dir = get_ejudge_contest_dir(ejudge_contest_id)
-    os.chdir(contest_dir)
     internal_name = None
     config = Config(ejudge_contest_id)
-    for i in range(len(config.problems)):
-        if 'id' in config.problems[i] and config.problems[i]['id'] == ejudge_problem_id:
-            internal_name = config.problems[i]['internal_name']
-            if not keep_config:
-                config.problems.pop(i)
-            break
+    problem = config.get_problem(ejudge_problem_id)
+    if problem is not None:
+        internal_name = problem['internal_name']
+        config.remove_problem(problem)
     config.write()
     if internal_name:
-        shutil.rmtree(os.path.join(contest_dir, "problems", str(internal_name)))
+        problem_dir = os.path.join(contest_dir, "problems", str(internal_name))
+        for path in [problem_dir, get_staging_dir(problem_dir), get_backup_dir(problem_dir)]:
+            if os.path.isdir(path):
+                remove_problem_dir(path)
 
 
+@tracing.traced('remove_contest', 'contest_id')
 def remove_contest(
         contest_id: int,
 ) -> None:
     contest_dir = get_ejudge_contest_dir(contest_id)
-    shutil.rmtree(os.path.join(contest_dir, "problems"))
+    problems_dir = os.path.join(contest_dir, "problems")
+    for problem_name in os.listdir(problems_dir):
+        if os.path.isdir(os.path.join(problems_dir, problem_name)):
+            remove_problem_dir(os.path.join(problems_dir, problem_name))
+    shutil.rmtree(problems_dir)
     config = Config(contest_id)
-    abstract_problems = []
-    for problem in config.problems:
-        if "abstract" in problem:
-            abstract_problems.append(problem.copy())
-    config.problems = abstract_problems
+    for problem in config.problems.copy():
+        if "abstract" not in problem:
+            config.remove_problem(problem)
     config.write()
-
-
-def add_subparsers(subparsers):
-    parser_remove_problem = subparsers.add_parser(
-        'rp',
-        help="Remove single problem"
-    )
-    parser_remove_problem.add_argument('contest_id', help='Id of contest in ejudge to remove problem', type=int)
-    parser_remove_problem.add_argument('problem_id', help='Problem id in ejudge', type=int)
-    parser_remove_problem.set_defaults(
-        func=lambda options: remove_problem(options.contest_id, options.problem_id)
-    )
-
-    parser_remove_contest = subparsers.add_parser(
-        'rc',
-        help="Remove all problems from contest"
-    )
-    parser_remove_contest.add_argument('contest_id', help='Id of contest in ejudge to remove', type=int)
-    parser_remove_contest.set_defaults(
-        func=lambda options: remove_contest(options.contest_id)
-    )
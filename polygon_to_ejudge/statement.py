@@ -1,31 +1,151 @@
+import hashlib
 import os
+import re
+import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
 
+from . import tracing
+from .common import atomic_write
 from .config import *
 
+pandoc_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'polygon-to-ejudge', 'pandoc')
+pandoc_version = None
+
+# Sections converted in one pandoc run are separated by paragraphs with this text
+SECTION_SEPARATOR = 'POLYGONTOEJUDGESECTION{}'
+SECTION_SEPARATOR_RE = re.compile(r'<p>POLYGONTOEJUDGESECTION\d+</p>\n?')
+
+# Commands whose result depends on the whole pandoc document: footnotes are numbered and moved to its end,
+# macros apply to the rest of it and header ids are made unique in it. Sections with them are converted separately
+DOCUMENT_WIDE_RE = re.compile(
+    r'\\(footnote|newcommand|renewcommand|providecommand|def|let|label|(sub)*section)(?![a-zA-Z])'
+)
+
+STATEMENT_SECTIONS = ['legend.tex', 'input.tex', 'output.tex', 'interaction.tex', 'notes.tex', 'scoring.tex']
 
-def latex_to_html(location: str, file_name: str) -> str:
-    text = open(os.path.join(location, file_name), 'r').read()
-    text = text.replace('\\t{', '\\texttt{').replace('<<', '«').replace('>>', '»')
 
-    text_ouput_file = open(os.path.join(location, file_name), 'w')
-    text_ouput_file.write(text)
-    text_ouput_file.close()
+def get_pandoc_version() -> str:
+    global pandoc_version
+    if pandoc_version is None:
+        try:
+            pandoc_version = subprocess.run(
+                ['pandoc', '--version'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).stdout.split('\n')[0]
+        except OSError:
+            pandoc_version = ''
+    return pandoc_version
 
-    os.system(RUN_PANDOC.format(
-        os.path.join(location, file_name),
-        os.path.join(location, "out.html"),
-    ))
-    result = open(os.path.join(location, "out.html")).read()
+
+def get_cache_path(text: str) -> str:
+    key = '\n'.join([get_pandoc_version(), RUN_PANDOC, text])
+    return os.path.join(pandoc_cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.html')
+
+
+def read_latex(location: str, file_name: str) -> str:
+    text = open(os.path.join(location, file_name), 'r').read()
+    return text.replace('\\t{', '\\texttt{').replace('<<', '«').replace('>>', '»')
+
+
+def run_pandoc(location: str, text: str) -> str:
+    fd, input_path = tempfile.mkstemp(dir=location, prefix='.pandoc', suffix='.tex')
+    output_path = input_path[:-len('.tex')] + '.html'
+    try:
+        with os.fdopen(fd, 'w') as input_file:
+            input_file.write(text)
+        tracing.count('subprocesses')
+        os.system(RUN_PANDOC.format(input_path, output_path))
+        if not os.path.exists(output_path):
+            raise Exception('pandoc failed to convert statement in {}'.format(location))
+        with open(output_path, 'r') as output_file:
+            return output_file.read()
+    finally:
+        for path in [input_path, output_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def save_to_cache(text: str, html: str) -> None:
+    try:
+        os.makedirs(pandoc_cache_dir, exist_ok=True)
+        atomic_write(get_cache_path(text), lambda cache_file: cache_file.write(html), mode=0o600)
+    except OSError as e:
+        print('Failed to save statement to cache: {}'.format(e))
+
+
+def convert_latex_files(files: list) -> list:
+    # Converts list of (location, file_name) to html. Results are cached by content,
+    # files that are not in cache are converted in one pandoc run, except for files
+    # with document-wide commands, which are converted one by one.
+    texts = [read_latex(location, file_name) for location, file_name in files]
+    results = [None] * len(files)
+    missing = []
+    for i, text in enumerate(texts):
+        cache_path = get_cache_path(text)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as cache_file:
+                results[i] = cache_file.read()
+        else:
+            missing.append(i)
+
+    if len(missing) == 0:
+        return results
+
+    batched = [i for i in missing if not DOCUMENT_WIDE_RE.search(texts[i])]
+    htmls = None
+    if len(batched) > 1:
+        joined_text = ''
+        for section_id, i in enumerate(batched):
+            joined_text += '\n\n{}\n\n'.format(SECTION_SEPARATOR.format(section_id)) + texts[i]
+        htmls = SECTION_SEPARATOR_RE.split(run_pandoc(files[batched[0]][0], joined_text))[1:]
+        if len(htmls) != len(batched):
+            print('Failed to split pandoc output into sections, converting them one by one')
+            htmls = None
+    if htmls is not None:
+        for i, html in zip(batched, htmls):
+            results[i] = html
+            save_to_cache(texts[i], html)
+
+    for i in missing:
+        if results[i] is None:
+            results[i] = run_pandoc(files[i][0], texts[i])
+            save_to_cache(texts[i], results[i])
+    return results
+
+
+def postprocess_html(result: str) -> str:
     result = result.replace('[0cm]', '')
     result = result.replace('<table>', '<table class="statements">')
     return result
 
 
+def latex_to_html(location: str, file_name: str) -> str:
+    return postprocess_html(convert_latex_files([(location, file_name)])[0])
+
+
+def convert_statements(locations: list) -> None:
+    # Converts sections of all statements of a problem in one pandoc run and saves them to cache
+    files = []
+    for location in locations:
+        statement_files = os.listdir(location)
+        for section in STATEMENT_SECTIONS:
+            if section in statement_files:
+                files.append((location, section))
+    if len(files) > 0:
+        convert_latex_files(files)
+
+
 def import_statement(location: str, language: str):
     statement_files = os.listdir(location)
     statement_files.sort()
 
+    sections = [section for section in STATEMENT_SECTIONS if section in statement_files]
+    section_htmls = convert_latex_files([(location, section) for section in sections])
+    section_htmls = dict(zip(sections, map(postprocess_html, section_htmls)))
+
     tree = ET.Element('problem')
     statement = ET.SubElement(tree, 'statement', language=language)
     examples = ET.SubElement(tree, 'examples')
@@ -37,24 +157,24 @@ def import_statement(location: str, language: str):
     format_statement = []
     format_example = []
     if 'legend.tex' in statement_files:
-        text = latex_to_html(location, 'legend.tex')
+        text = section_htmls['legend.tex']
         legend += text
         informatics_statement += INFORMATICS_LEGEND.format(text)
 
     if 'input.tex' in statement_files:
         ET.SubElement(statement, 'input_format').text = '{}'
-        text = latex_to_html(location, 'input.tex')
+        text = section_htmls['input.tex']
         format_statement.append(text)
         informatics_statement += INFORMATICS_INPUT.format(text)
 
     if 'output.tex' in statement_files:
         ET.SubElement(statement, 'output_format').text = '{}'
-        text = latex_to_html(location, 'output.tex')
+        text = section_htmls['output.tex']
         format_statement.append(text)
         informatics_statement += INFORMATICS_OUTPUT.format(text)
 
     if 'interaction.tex' in statement_files:
-        text = latex_to_html(location, 'interaction.tex')
+        text = section_htmls['interaction.tex']
         legend += INTERACTION_TEXT[language].format(text)
         informatics_statement += INFORMATICS_INTERACTION.format(text)
 
@@ -64,12 +184,12 @@ def import_statement(location: str, language: str):
 
     notes = ''
     if 'notes.tex' in statement_files:
-        text = latex_to_html(location, 'notes.tex')
+        text = section_htmls['notes.tex']
         notes += text
         informatics_statement += INFORMATICS_NOTES.format(text)
 
     if 'scoring.tex' in statement_files:
-        text = latex_to_html(location, 'scoring.tex')
+        text = section_htmls['scoring.tex']
         notes += SCORING_TEXT[language].format(text)
         informatics_statement += INFORMATICS_SCORING.format(text)
     if len(notes) > 0:
@@ -96,39 +216,40 @@ def import_statement(location: str, language: str):
     return res
 
 
+STATEMENT_XML_TOKEN_RE = re.compile(r'&amp;gt;|&amp;lt;|&lt;|&gt;|\\textgreater|\\textsmaller|\\[()\[\]]|>')
+
+
 def process_statement_xml(statement):
-    result = ''
+    # Single pass over the statement: text between tokens is copied as is,
+    # only the last characters of the result are kept to check for <input> and <output>
+    result = []
+    tail = ''
     in_math = False
-    for ch in statement:
-        result += ch
-        if result[-1] == '>' and not result.endswith('<input>') and not result.endswith('<output>'):
-            result += '\n'
-        if result.endswith('&lt;'):
-            result = result[:-4]
-            if in_math:
-                result += '\\lt'
-            else:
-                result += '<'
-        if result.endswith('&gt;'):
-            result = result[:-4]
-            if in_math:
-                result += '\\gt'
-            else:
-                result += '>'
-        if result.endswith('&amp;gt;'):
-            result = result[:-len('&amp;gt;')]
-            result += '\\gt'
-        if result.endswith('&amp;lt;'):
-            result = result[:-len('&amp;lt;')]
-            result += '\\lt'
-        if result.endswith('\\textgreater'):
-            result = result[:-len('\\textgreater')]
-            result += '\\gt'
-        if result.endswith('\\textsmaller'):
-            result = result[:-len('\\textsmaller')]
-            result += '\\lt'
-        if result.endswith('\\(') or result.endswith('\\['):
-            in_math = True
-        if result.endswith('\\)') or result.endswith('\\]'):
-            in_math = False
-    return result
+    pos = 0
+    for match in STATEMENT_XML_TOKEN_RE.finditer(statement):
+        text = statement[pos:match.start()]
+        token = match.group()
+        pos = match.end()
+
+        if token == '>':
+            text += '>'
+            last = (tail + text[-len('<output>'):])[-len('<output>'):]
+            if not last.endswith('<input>') and not last.endswith('<output>'):
+                text += '\n'
+        elif token == '&lt;':
+            text += '\\lt' if in_math else '<'
+        elif token == '&gt;':
+            text += '\\gt' if in_math else '>'
+        elif token in ('&amp;gt;', '\\textgreater'):
+            text += '\\gt'
+        elif token in ('&amp;lt;', '\\textsmaller'):
+            text += '\\lt'
+        else:
+            text += token
+            in_math = token in ('\\(', '\\[')
+
+        result.append(text)
+        tail = (tail + text[-len('<output>'):])[-len('<output>'):]
+
+    result.append(statement[pos:])
+    return ''.join(result)
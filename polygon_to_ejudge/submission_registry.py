@@ -0,0 +1,39 @@
+import hashlib
+import json
+import os
+
+from .common import atomic_write, get_ejudge_contest_dir
+
+REGISTRY_FILE_NAME = 'submissions.json'
+
+
+class SubmissionRegistry:
+    # Run ids of submitted solutions by problem, language and hash of submitted source,
+    # so that the same solution is not submitted twice
+    def __init__(self, contest_id: int):
+        self.path = os.path.join(get_ejudge_contest_dir(contest_id), REGISTRY_FILE_NAME)
+        try:
+            with open(self.path, 'r') as fo:
+                self.submissions = json.load(fo)
+        except (OSError, ValueError):
+            self.submissions = {}
+        self.changed = False
+
+    @staticmethod
+    def get_key(problem_id: int, lang_id: int, data: str) -> str:
+        digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        return '{}:{}:{}'.format(problem_id, lang_id, digest)
+
+    def find(self, problem_id: int, lang_id: int, data: str):
+        # Returns entry with run id if the solution was already submitted
+        return self.submissions.get(self.get_key(problem_id, lang_id, data))
+
+    def add(self, problem_id: int, lang_id: int, data: str, run_id) -> None:
+        self.submissions[self.get_key(problem_id, lang_id, data)] = {'run_id': run_id}
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        atomic_write(self.path, lambda fo: json.dump(self.submissions, fo, indent=1, sort_keys=True))
+        self.changed = False
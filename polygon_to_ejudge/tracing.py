@@ -0,0 +1,121 @@
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# Timing spans of import phases, recorded only when tracing is enabled.
+# Counters (bytes, subprocesses) are added to all spans that are open in the current thread,
+# functions run in thread pools should be wrapped with bind to count their work in caller spans.
+enabled = False
+start_time = time.perf_counter()
+spans = []
+spans_lock = threading.Lock()
+local = threading.local()
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+
+def get_stack() -> list:
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    if not enabled:
+        yield
+        return
+    record = {
+        'name': name,
+        'thread': threading.current_thread().name,
+        'start': time.perf_counter() - start_time,
+        'attrs': attrs,
+        'counters': {},
+    }
+    stack = get_stack()
+    stack.append(record)
+    try:
+        yield
+    finally:
+        stack.pop()
+        record['duration'] = time.perf_counter() - start_time - record['start']
+        with spans_lock:
+            spans.append(record)
+
+
+def traced(name: str, *arg_names):
+    # Decorator which records calls of function as spans, with values of given arguments
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs).arguments
+            attrs = {arg_name: arguments[arg_name] for arg_name in arg_names if arg_name in arguments}
+            with span(name, **attrs):
+                return function(*args, **kwargs)
+        return run
+    return decorator
+
+
+def count(counter: str, value=1) -> None:
+    if not enabled:
+        return
+    with spans_lock:
+        for record in get_stack():
+            record['counters'][counter] = record['counters'].get(counter, 0) + value
+
+
+def bind(function):
+    # Returns function which counts its work in spans that are open now in this thread
+    if not enabled:
+        return function
+    parent_stack = list(get_stack())
+
+    def run(*args, **kwargs):
+        old_stack = get_stack()
+        local.stack = list(parent_stack)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            local.stack = old_stack
+    return run
+
+
+def dump(path: str) -> None:
+    # Spans are written in Chrome trace format, which can be opened in chrome://tracing or Perfetto
+    thread_ids = {}
+    events = []
+    with spans_lock:
+        records = sorted(spans, key=lambda record: record['start'])
+    for record in records:
+        args = dict(record['attrs'])
+        args.update(record['counters'])
+        events.append({
+            'name': record['name'],
+            'ph': 'X',
+            'ts': round(record['start'] * 1e6),
+            'dur': round(record['duration'] * 1e6),
+            'pid': os.getpid(),
+            'tid': thread_ids.setdefault(record['thread'], len(thread_ids) + 1),
+            'args': args,
+        })
+    for thread_name, thread_id in thread_ids.items():
+        events.append({
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'tid': thread_id,
+            'args': {'name': thread_name},
+        })
+    with open(path, 'w') as trace_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file, indent=1)
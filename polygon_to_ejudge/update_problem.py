@@ -1,67 +1,121 @@
 import os
 
+from . import polygon_session
+from . import tracing
 from .common import get_ejudge_contest_dir, Config
+from .import_journal import ImportJournal, get_imported_revision
 from .import_problem import import_problem
-from .remove_problem import remove_problem
+from .package_cache import get_latest_revision
+from .problem_files import get_backup_dir, rollback_problem_dir
 
 
+@tracing.traced('update_problem', 'ejudge_contest_id', 'ejudge_problem_id')
 def update_problem(
         ejudge_contest_id: int,
         ejudge_problem_id: int,
-        no_offline=False
+        no_offline=False,
+        contest_config=None,
+        latest_revision=None,
 ) -> None:
+    # If contest_config is given, it is changed instead of serve.cfg and the caller writes it.
+    # If latest_revision is given, it is not requested from polygon again
     contest_dir = get_ejudge_contest_dir(ejudge_contest_id)
-    os.chdir(contest_dir)
-    config = Config(ejudge_contest_id)
+    config = contest_config if contest_config is not None else Config(ejudge_contest_id)
 
     polygon_id = None
 
     short_name = None
+    internal_name = None
 
-    for problem in config.problems:
-        if 'id' in problem and problem["id"] == ejudge_problem_id:
-            if "extid" in problem:
-                polygon_id = problem["extid"]
-                polygon_id = int(polygon_id[polygon_id.find(":") + 1:])
-                if "short_name" in problem:
-                    short_name = problem["short_name"]
+    problem = config.get_problem(ejudge_problem_id)
+    if problem is not None and "extid" in problem:
+        polygon_id = problem["extid"]
+        polygon_id = int(polygon_id[polygon_id.find(":") + 1:])
+        if "short_name" in problem:
+            short_name = problem["short_name"]
+        if "internal_name" in problem:
+            internal_name = str(problem["internal_name"])
 
     if not polygon_id:
         raise Exception("No polygon id found, can not update")
 
-    remove_problem(ejudge_contest_id, ejudge_problem_id, keep_config=True)
-    import_problem(ejudge_contest_id, polygon_id, short_name, ejudge_problem_id, no_offline=no_offline)
+    # Existing problem folder is replaced with the new version at once, only changed files are written
+    if internal_name is None or not os.path.isdir(os.path.join(contest_dir, 'problems', internal_name)):
+        internal_name = None
+    import_problem(
+        ejudge_contest_id,
+        polygon_id,
+        short_name,
+        ejudge_problem_id,
+        no_offline=no_offline,
+        internal_name=internal_name,
+        contest_config=contest_config,
+        latest_revision=latest_revision,
+    )
+
+
+def rollback_problem(
+        ejudge_contest_id: int,
+        ejudge_problem_id: int,
+) -> None:
+    # Files of the problem are swapped with the version before the last update,
+    # problem config in serve.cfg is not changed
+    contest_dir = get_ejudge_contest_dir(ejudge_contest_id)
+    problem = Config(ejudge_contest_id).get_problem(ejudge_problem_id)
+    if problem is None or 'internal_name' not in problem:
+        raise Exception('Problem {} not found in contest {}'.format(ejudge_problem_id, ejudge_contest_id))
+    problem_dir = os.path.join(contest_dir, 'problems', str(problem['internal_name']))
+    if not os.path.isdir(get_backup_dir(problem_dir)):
+        raise Exception('No previous version of problem {} to roll back to'.format(ejudge_problem_id))
+    rollback_problem_dir(problem_dir)
+    print('Problem {} is rolled back, run the command again to undo'.format(ejudge_problem_id))
 
 
+@tracing.traced('update_contest', 'contest_id')
 def update_contest(
         contest_id: int,
-        no_offline=False
+        no_offline=False,
+        force=False,
 ) -> None:
+    contest_dir = get_ejudge_contest_dir(contest_id)
     config = Config(contest_id)
-    for problem in config.problems:
-        if 'extid' in problem:
-            if problem['extid'].startswith('polygon'):
-                update_problem(contest_id, problem['id'], no_offline)
-
 
-def add_subparsers(subparsers):
-    parser_update_problem = subparsers.add_parser(
-        'up',
-        help="Update single problem"
-    )
-    parser_update_problem.add_argument('contest_id', help='Id of contest in ejudge', type=int)
-    parser_update_problem.add_argument('problem_id', help='Problem id in ejudge', type=int)
-    parser_update_problem.add_argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true")
-    parser_update_problem.set_defaults(
-        func=lambda options: update_problem(options.contest_id, options.problem_id, options.no_offline)
-    )
+    session = polygon_session.get_polygon_session()
 
-    parser_update_contest = subparsers.add_parser(
-        'uc',
-        help="Update each problem in ejudge contest"
-    )
-    parser_update_contest.add_argument('contest_id', help='Ejudge contest id', type=int)
-    parser_update_contest.add_argument('-n', "--no-offline", help="Ignore offline groups in valuer", action="store_true")
-    parser_update_contest.set_defaults(
-        func=lambda options: update_contest(options.contest_id, options.no_offline)
-    )
+    # serve.cfg is written after every updated problem, and the problem is added to journal,
+    # so if the command fails, running it again skips problems that are already updated
+    journal = ImportJournal(contest_id, 'uc --force' if force else 'uc')
+    try:
+        for problem in config.problems.copy():
+            if 'extid' in problem:
+                if problem['extid'].startswith('polygon'):
+                    entry = journal.find(str(problem['id']), config)
+                    if entry is not None:
+                        print("Problem {} is already updated (revision {})".format(problem['id'], entry['revision']))
+                        continue
+                    latest_revision = None
+                    if not force and 'internal_name' in problem:
+                        imported_revision = get_imported_revision(contest_dir, problem['internal_name'])
+                        if imported_revision is not None:
+                            polygon_id = int(problem['extid'][problem['extid'].find(':') + 1:])
+                            latest_revision = get_latest_revision(session, polygon_id)
+                            if imported_revision == latest_revision:
+                                print("Problem {} is up to date (revision {})".format(problem['id'], imported_revision))
+                                continue
+                    # Revision that was already requested is passed to the import, so it is not requested twice
+                    update_problem(contest_id, problem['id'], no_offline, contest_config=config,
+                                   latest_revision=latest_revision)
+                    config.write()
+                    internal_name = config.get_problem(problem['id'])['internal_name']
+                    journal.add(
+                        str(problem['id']),
+                        problem['id'],
+                        internal_name,
+                        get_imported_revision(contest_dir, internal_name),
+                    )
+        journal.remove()
+    except:
+        print('Run the command again to continue update from the failed problem')
+        raise
+    finally:
+        config.write()
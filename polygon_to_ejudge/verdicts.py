@@ -0,0 +1,88 @@
+import os
+import time
+import xml.etree.ElementTree as ET
+
+from . import tracing
+from .common import Config, get_ejudge_contest_dir
+from .config import VERDICT_POLL_INTERVAL, VERDICT_POLL_MAX_INTERVAL, VERDICT_TIMEOUT, EXPECTED_VERDICTS
+
+# Statuses of runs which are not judged yet
+TRANSIENT_STATUSES = ['PD', 'FR', 'RU', 'CD', 'CG', 'AV']
+
+
+def get_solution_tags(problem_dir: str) -> dict:
+    # Polygon tags of solutions by file name, main solution is also copied to problem folder
+    # root, possibly with dpr extension replaced by pas
+    tags = {}
+    problem_xml_path = os.path.join(problem_dir, 'problem.xml')
+    if not os.path.exists(problem_xml_path):
+        return tags
+    tree = ET.parse(problem_xml_path).getroot()
+    for solution in tree.find('assets').find('solutions'):
+        file_name = os.path.basename(solution.find('source').attrib['path'])
+        tags[file_name] = solution.attrib['tag']
+        if file_name.endswith('.dpr'):
+            tags[file_name[:-3] + 'pas'] = solution.attrib['tag']
+    return tags
+
+
+@tracing.traced('wait_for_verdicts')
+def wait_for_verdicts(session, runs: list) -> dict:
+    # Polls statuses of all runs at once. Delay between polls is doubled while nothing
+    # changes and is reset when some run gets its verdict
+    pending = [run['run_id'] for run in runs if run['run_id'] is not None]
+    verdicts = {}
+    interval = VERDICT_POLL_INTERVAL
+    deadline = time.monotonic() + VERDICT_TIMEOUT
+    while len(pending) > 0:
+        statuses = session.get_run_statuses(pending)
+        judged = [run_id for run_id, status in statuses.items() if status not in TRANSIENT_STATUSES]
+        for run_id in judged:
+            verdicts[run_id] = statuses[run_id]
+        pending = [run_id for run_id in pending if run_id not in verdicts]
+        if len(pending) == 0:
+            break
+        if time.monotonic() + interval > deadline:
+            print('Timed out waiting for {} runs'.format(len(pending)))
+            break
+        print('Waiting for {} runs'.format(len(pending)))
+        time.sleep(interval)
+        if len(judged) > 0:
+            interval = VERDICT_POLL_INTERVAL
+        else:
+            interval = min(interval * 2, VERDICT_POLL_MAX_INTERVAL)
+    return verdicts
+
+
+def check_verdicts(contest_id: int, session, runs: list) -> bool:
+    # Prints runs whose verdicts do not match Polygon tags of their solutions
+    contest_dir = get_ejudge_contest_dir(contest_id)
+    config = Config(contest_id)
+    verdicts = wait_for_verdicts(session, runs)
+
+    tags_by_problem = {}
+    mismatches = 0
+    unknown = 0
+    for run in sorted(runs, key=lambda run: (run['problem_id'], run['solution_path'], run['lang_id'])):
+        problem_id = run['problem_id']
+        if problem_id not in tags_by_problem:
+            problem = config.get_problem(problem_id)
+            problem_dir = os.path.join(contest_dir, 'problems', str(problem['internal_name']))
+            tags_by_problem[problem_id] = get_solution_tags(problem_dir)
+        tag = tags_by_problem[problem_id].get(os.path.basename(run['solution_path']))
+        verdict = verdicts.get(run['run_id'])
+
+        description = 'Problem {}, {} (lang {}, run {})'.format(
+            problem_id, os.path.basename(run['solution_path']), run['lang_id'], run['run_id'])
+        if verdict is None:
+            print('{}: no verdict'.format(description))
+            unknown += 1
+        elif tag is None or tag not in EXPECTED_VERDICTS:
+            print('{}: {}, unknown tag {}'.format(description, verdict, tag))
+            unknown += 1
+        elif verdict not in EXPECTED_VERDICTS[tag]:
+            print('{}: {}, expected {} ({})'.format(description, verdict, tag, ' '.join(EXPECTED_VERDICTS[tag])))
+            mismatches += 1
+
+    print('Checked {} runs: {} mismatches, {} unknown'.format(len(runs), mismatches, unknown))
+    return mismatches == 0 and unknown == 0